@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite
+
+Synthetic sessions (synthetic.py: RINEX 3, navigation files, SP3) of given durations
+and rates are generated in a temporary folder and processed stage by stage. For every
+stage wall time, speed and peak memory are printed. Peak memory is measured by
+tracemalloc in a separate run of the stage (Python and numpy allocations, memory-mapped
+files are not counted), so it does not distort the time.
+
+Stages:
+    parse - PyGNSS.__parseRINEX__, conversion of observations and navigation files
+    sp3 - PyGNSS.__parseEphemeris__, conversion of SP3
+    open - PyGNSS() of converted folder
+    nav - broadcast ephemeris of all GNSS for all epochs (PyGNSS.interpolate, source='nav')
+    load - creation of all satellites (observations and interpolated ephemeris), reading of C1C
+    cuttime - cut of the middle half of session
+    filt - 100 filt calls (gnss, prn, num)
+    query - 100 query calls (composed SVQuery conditions)
+    getobs - 100 getobs calls
+    spp - single point positioning of all epochs
+
+Usage:
+    python benchmark.py [rate, s] [hours ...] [--stages parse,open,...] [--input rnx|rnx.gz|crx|crx.gz]
+    without rate and hours the matrix of CONFIGS is measured;
+    --input - format of observation file: RINEX, Hatanaka (synthetic.write_crx), gzip-compressed
+
+Results (one core, Python 3.11, numpy 2, full constellations G32/R24/E30, ~27 SV visible;
+speed - session epochs or calls per second):
+    rate    hours   epochs  stage       time, s      speed           peak MB
+      30    24.00     2880  parse         0.566       5087 epochs/s     25.0
+      30    24.00     2880  sp3           0.043      66671 epochs/s      0.7
+      30    24.00     2880  open          0.001    5588142 epochs/s      0.0
+      30    24.00     2880  nav           0.166      17398 epochs/s     44.3
+      30    24.00     2880  load          0.027     106611 epochs/s     12.9
+      30    24.00     2880  cuttime       0.002    1475196 epochs/s      0.2
+      30    24.00     2880  filt          0.002      46046 calls/s       0.1
+      30    24.00     2880  query         0.011       8720 calls/s       0.4
+      30    24.00     2880  getobs        0.024       4183 calls/s      12.6
+      30    24.00     2880  spp           0.337       8553 epochs/s     78.3
+       1     1.00     3600  parse         0.490       7353 epochs/s     27.7
+       1     1.00     3600  sp3           0.006     641964 epochs/s      0.1
+       1     1.00     3600  open          0.000    8664969 epochs/s      0.0
+       1     1.00     3600  nav           0.176      20455 epochs/s     44.9
+       1     1.00     3600  load          0.018     203894 epochs/s     15.7
+       1     1.00     3600  cuttime       0.001    3458230 epochs/s      0.1
+       1     1.00     3600  filt          0.002      57460 calls/s       0.1
+       1     1.00     3600  query         0.008      11840 calls/s       0.3
+       1     1.00     3600  getobs        0.023       4354 calls/s      15.7
+       1     1.00     3600  spp           0.366       9833 epochs/s     75.8
+       1     4.00    14400  parse         2.858       5038 epochs/s     27.8
+       1     4.00    14400  sp3           0.011    1337480 epochs/s      0.2
+       1     4.00    14400  open          0.000   30124389 epochs/s      0.0
+       1     4.00    14400  nav           0.878      16400 epochs/s     88.0
+       1     4.00    14400  load          0.070     206525 epochs/s     62.6
+       1     4.00    14400  cuttime       0.002    6766863 epochs/s      0.2
+       1     4.00    14400  filt          0.002      57017 calls/s       0.1
+       1     4.00    14400  query         0.008      12252 calls/s       0.3
+       1     4.00    14400  getobs        0.057       1742 calls/s      62.5
+       1     4.00    14400  spp           1.332      10813 epochs/s     91.9
+     0.1     0.25     9000  parse         2.252       3997 epochs/s     27.8
+     0.1     0.25     9000  sp3           0.008    1074717 epochs/s      0.1
+     0.1     0.25     9000  open          0.001   13138168 epochs/s      0.0
+     0.1     0.25     9000  nav           0.681      13208 epochs/s     66.2
+     0.1     0.25     9000  load          0.089     100634 epochs/s     49.5
+     0.1     0.25     9000  cuttime       0.000   24195695 epochs/s      0.0
+     0.1     0.25     9000  filt          0.003      29229 calls/s       0.0
+     0.1     0.25     9000  query         0.018       5560 calls/s       0.2
+     0.1     0.25     9000  getobs        0.112        893 calls/s      39.1
+     0.1     0.25     9000  spp           1.234       7291 epochs/s     95.4
+Exact numbers depend on the machine; speeds of parse and spp must not fall with duration.
+The 10 Hz rows are measured with all epochs on the grid (sub-second epoch times). Reduced at parse
+time the same session converts faster and in less memory: decimate=10 - 0.27 s, 15 MB;
+time_interval=1, aggregate='mean' or 'median' (all lines are read, code is averaged per second) - 2.0 s, 15 MB.
+With --input rnx.gz parse speed is within the measurement noise of rnx, with crx and crx.gz
+(Hatanaka decoding) parse is about 1.5 times slower.
+Observations are stored by visibility arcs (only epochs with measurements): for these sessions
+observation files are about 3 times smaller than dense arrays of all SV cells; load, getobs and spp
+assemble dense arrays from arcs on access.
+"""
+
+import argparse
+import gzip
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from pygnss import PyGNSS, SVQuery
+import synthetic
+
+# (шаг, с; длительность, ч)
+CONFIGS = [(30, 24), (1, 1), (1, 4), (0.1, 0.25)]
+
+
+def stage_parse(file_name, rate):
+    shutil.rmtree(file_name + PyGNSS.__pathext__, ignore_errors=True)
+    gnss = PyGNSS.__new__(PyGNSS)
+    gnss.path = os.path.abspath(file_name + PyGNSS.__pathext__)
+    return lambda: gnss.__parseRINEX__(file_name, rate), 'epochs'
+
+
+def stage_sp3(file_name, rate):
+    gnss = PyGNSS(file_name, rate)
+    return lambda: gnss.__parseEphemeris__(PyGNSS.__splitext__(file_name)[0][:-3] + 'sp3'), 'epochs'
+
+
+def stage_open(file_name, rate):
+    return lambda: PyGNSS(file_name, rate), 'epochs'
+
+
+def stage_nav(file_name, rate):
+    gnss = PyGNSS(file_name, rate)
+    return lambda: [gnss.interpolate(gnss.continious_time, name, source='nav') for name in 'GRE'], 'epochs'
+
+
+def stage_load(file_name, rate):
+    gnss = PyGNSS(file_name, rate)
+    return lambda: [SV['C1C'].sum() for SV in gnss], 'epochs'
+
+
+def stage_cuttime(file_name, rate):
+    gnss = PyGNSS(file_name, rate)
+    list(gnss)
+    time_start, time_end = gnss.time[len(gnss.time) // 4], gnss.time[3 * len(gnss.time) // 4]
+    return lambda: gnss.cuttime(time_start, time_end), 'epochs'
+
+
+def stage_filt(file_name, rate):
+    gnss = PyGNSS(file_name, rate)
+    gnss.SVtable
+    list_options = [{'gnss': 'G'}, {'gnss': 'RE'}, {'gnss': 'R', 'prn': range(-7, 0)}, {'num': range(1, 10)}]
+    return lambda: [gnss.filt(**list_options[num % 4]) for num in range(100)], 'calls'
+
+
+def stage_query(file_name, rate):
+    gnss = PyGNSS(file_name, rate)
+    gnss.SVtable
+    query = (SVQuery(gnss='G') & SVQuery(obs='L2W')) | (SVQuery(gnss='R') & ~SVQuery(prn=range(-7, 0)))
+    return lambda: [gnss.query(query, num=range(1, 20)) for num in range(100)], 'calls'
+
+
+def stage_getobs(file_name, rate):
+    gnss = PyGNSS(file_name, rate)
+    list_time = [gnss.continious_time[num * len(gnss.time) // 100] for num in range(100)]
+    return lambda: [gnss.getobs(timestamp) for timestamp in list_time], 'calls'
+
+
+def stage_spp(file_name, rate):
+    gnss = PyGNSS(file_name, rate)
+    return lambda: gnss.spp(), 'epochs'
+
+
+STAGES = {'parse': stage_parse, 'sp3': stage_sp3, 'open': stage_open, 'nav': stage_nav, 'load': stage_load,
+          'cuttime': stage_cuttime, 'filt': stage_filt, 'query': stage_query, 'getobs': stage_getobs,
+          'spp': stage_spp}
+
+
+def measure(stage, file_name, rate):
+    ''' Время и пиковая память стадии: (время, с; единицы; пик, МБ)'''
+    run, units = stage(file_name, rate)
+    time_start = time.perf_counter()
+    run()
+    duration = time.perf_counter() - time_start
+    run, units = stage(file_name, rate)
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return duration, units, peak
+
+
+def compress(file_name, input_format):
+    ''' Файл измерений в формате input_format: rnx - RINEX 3, crx - Hatanaka, .gz - сжатый gzip'''
+    if input_format.startswith('crx'):
+        synthetic.write_crx(file_name, file_name[:-1] + 'd')
+        os.remove(file_name)
+        file_name = file_name[:-1] + 'd'
+    if input_format.endswith('.gz'):
+        with open(file_name, 'rb') as file_src, gzip.open(file_name + '.gz', 'wb') as file_dst:
+            shutil.copyfileobj(file_src, file_dst)
+        os.remove(file_name)
+        file_name += '.gz'
+    return file_name
+
+
+def bench(rate, hours, list_stages, input_format='rnx'):
+    ''' Все стадии для одной синтетической сессии, печать строк таблицы'''
+    with tempfile.TemporaryDirectory() as path:
+        file_name = os.path.join(path, 'bench.16o')
+        num_epochs = synthetic.write_session(file_name, hours, rate)
+        file_name = compress(file_name, input_format)
+        for name in list_stages:
+            duration, units, peak = measure(STAGES[name], file_name, rate)
+            if name == 'parse':
+                # папка без эфемерид: остальные стадии преобразуют файлы полностью
+                shutil.rmtree(file_name + PyGNSS.__pathext__)
+            count = 100 if units == 'calls' else num_epochs
+            print('{:>8g} {:8.2f} {:8d}  {:<8} {:10.3f} {:10.0f} {:<8} {:8.1f}'.format(
+                rate, hours, num_epochs, name, duration, count / max(duration, 1e-9), units + '/s', peak))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='PyGNSS benchmark suite')
+    parser.add_argument('rate', nargs='?', type=float, help='observation rate, s')
+    parser.add_argument('hours', nargs='*', type=float, help='session durations, h')
+    parser.add_argument('--stages', default=','.join(STAGES), help='comma-separated stages')
+    parser.add_argument('--input', default='rnx', choices=['rnx', 'rnx.gz', 'crx', 'crx.gz'],
+                        help='observation file format')
+    args = parser.parse_args()
+    list_stages = args.stages.split(',')
+    if args.rate is None:
+        list_configs = CONFIGS
+    else:
+        list_configs = [(args.rate, hours) for hours in args.hours or [0.5, 1, 2, 4]]
+    print('{:>8} {:>8} {:>8}  {:<8} {:>10} {:>10} {:<8} {:>8}'.format(
+        'rate', 'hours', 'epochs', 'stage', 'time, s', 'speed', '', 'peak MB'))
+    for rate, hours in list_configs:
+        bench(rate, hours, list_stages, args.input)
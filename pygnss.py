@@ -7,18 +7,43 @@ Created on Fri May 20 15:20:33 2016
 
 Python GNSS framework
 
-GNSS data is converted to separate files and moved to folder with same name as data file
+GNSS data is converted to separate files and moved to folder with same name as data file:
+    manifest.json - SV list, observation types, ephemeris types, GLONASS liter table,
+        position of the last converted epoch in RINEX file and fingerprint of the bytes read after it (tail)
+    time.npy - time array
+    G.obs.npy, R.obs.npy... - measurements of GNSS by SV visibility arcs: rows of epochs with measurements
+        (rows x observation types), arcs of every SV are stored contiguously
+    G.arcs.npy, R.arcs.npy... - arcs tables of GNSS: SV index, first epoch, epoch after last, first row;
+        dense arrays (epochs x SV x observation types, nan out of arcs) are assembled on access
+    ephtime.npy - ephemeris nodes time array (SP3 epochs)
+    G.xyz.npy, R.xyz.npy... - ephemeris arrays of GNSS (nodes x SV x x,y,z,dt), km and microseconds
+    G.nav.npy, R.nav.npy, E.nav.npy - broadcast ephemeris records of RINEX 3 navigation files
+        (.g, .n, .l, .p next to observation file): records x SV number, toc, reference time, record fields
+Data files may be Hatanaka-compressed (CRINEX 3: .d, .crx) and gzip/compress/bzip2-compressed
+(.gz, .Z, .bz2): they are decompressed while reading, without temporary files; refresh works only
+for plain RINEX files.
+SV index in GNSS arrays is SV number - 1.
+Arrays are memory-mapped on opening. Folders of older formats are converted on first opening.
 
 Attributes:
     __pathext__ - folder name extension
     __obsext__ - observation files extension
+    __arcsext__ - arcs tables files extension
+    __manifest__ - folder description file name
     path - data-folder path
-    time - time array, datetime type
-    continious_time - time array, float type
+    time - time array, TimeAxis type: datetime objects are created on element access,
+        np.asarray(time), time.datetime64() - datetime64 array (vectorized)
+    continious_time - time array, float type (view of time grid)
     SV_list - filtered satellite names list
     SV_list_full - full satellite names list
-    G01,G02...R07...E15...C12...(RINEX names) - containers with GNSS data(dict):
-        .C1C, .L2P... (RINEX names) - measurements array, numpy.array type
+    stats - stage statistics (with stats option, else None): {stage: {calls, time, counters}},
+        stages header, parse, write, nav, sp3, open, migrate, loadSV, SVtable, interpolate,
+        cuttime, refresh, spp; counters - epochs, bytes_read, bytes_written...
+    SVtable - satellite properties table by columns (dict of numpy arrays, row - SV of SV_list_full),
+        created on first access: name, gnss, num, prn, fullname, first/last - visibility span,
+        obs - presence of observation types (SV x obs_types)
+    G01,G02...R07...E15...C12...(RINEX names) - containers with GNSS data(dict), created on first access:
+        .C1C, .L2P... (RINEX names) - measurements array, numpy.array type (assembled from arcs)
         .x, .y, .z - satellite coordinates, numpy.array type
         .dt - satellite clock, numpy.array type
         .num - satellite number, int
@@ -27,28 +52,89 @@ Attributes:
         .fullname - full RINEX name (with liter)
         
 Methods:
-    __init__ - creating.
+    __init__(file_name, time_interval=30, eph_order=9, stats=None, decimate=1, aggregate=None) - creating,
+        file_name - RINEX 3 observation file (.o, .d, ..._MO.rnx/.crx, compressed .gz/.Z/.bz2)
+        time_interval - minimal time grid step, s (not less than file rate, sub-second epochs are supported)
+        decimate - every decimate-th epoch of the grid is kept
+        aggregate - 'mean'/'median': code observations of all file epochs within +-step/2 of grid epoch
+            are averaged, other observations are taken at the grid epoch; applied while parsing
+        eph_order - Lagrange interpolation order of ephemeris nodes
+        stats - opt-in stage statistics: True, dict to accumulate into, callback(stage, record)
+            or logging.Logger; without stats nothing is measured
     
     __iter__, __next__ - SV  attributes iteration from .SV_list
     
     
     
---->    getobs(timestamp) - return a dict with observations for specified time point
-        input: timestamp, datetime type
-        output: dict with keys:
+    getobs(timestamp, gnss=None) - return a dict with observations for specified time point
+        input: timestamp, datetime or float type; gnss='G'/'R'/'E'
+        output: dict with keys (index = SV number - 1):
             .C1C, .L2P... (RINEX names) - array of measurements for all SV
-            .x, .y, .z - array of coordinate for all SV
+            .x, .y, .z, .dt - array of coordinate for all SV
             coordinates - matrice of satellite coordinates
             name, num, prn - arrays of SV attributes
+        without gnss: dict {gnss: dict with observations}
         
     
     filt - filtering by parameters:
         gnss='G'/'R'/'E'/'C'
         prn=-7:6
         num=1:32
-======>     time
+        time=(start, end) - epochs window of full time grid, datetime/float/None
 
-    reset - reset .SV_list to .SV_list_full
+    query(*queries, **options) - SV selection by SVQuery conditions, parent object is not changed
+        output: PyGNSS view with selected .SV_list, arrays are shared
+
+    SVQuery(gnss=, num=, prn=, name=, obs='L2P', visible=(start, end)) - SV condition,
+        combined with &, |, ~; SVQuery.between(column, low, high) - range condition
+
+    reset - reset .SV_list to .SV_list_full and time to full time grid
+
+    cuttime(start_time, end_time) - cut time inside current window, binary search of bounds,
+        arrays of created SV are sliced (no copying)
+        output: self
+
+    refresh() - reading of new epochs of growing RINEX file (real-time receiver logging),
+        arrays are extended in place, time depends only on new data size; a shortened or rewritten file
+        is converted again; called on opening if the RINEX file is still in place
+        output: number of added epochs
+
+    stream(file_name, chunk_epochs, time_interval, resume, decimate, aggregate) - RINEX 3 reading by blocks
+        of time grid epochs, generator of dicts with numpy arrays, memory does not depend on file length;
+        epoch times are read with fractions of second, grid positions are computed in integer nanoseconds
+
+    interpolate(time_query, gnss, order=None, source=None) - satellite coordinates and clock for arbitrary time,
+        input: time_query - float array (moments) common for all SV or (moments x SV), e.g. transmit time;
+            source - 'sp3' or 'nav', by default sp3 if it exists, else broadcast ephemeris
+        output: array (moments x SV x x,y,z,dt); sp3: coordinates by Lagrange polynomial, clock - linear;
+            nav: Keplerian orbits of GPS/Galileo, Runge-Kutta integration of GLONASS state vectors
+
+    spp(obs_type='C1C', gnss=None, elevation_mask=10) - single point positioning for all epochs at once,
+        weighted least squares with batched numpy linear algebra, clock offset for every GNSS
+        output: dict of arrays: x, y, z (km), coordinates, dt - {gnss: receiver clock, us},
+            GDOP, PDOP, HDOP, VDOP, TDOP - {gnss: TDOP}, num - number of SV in solution
+
+    frequency(gnss, obs_type) - carrier frequencies of observation type for all SV cells, Hz
+        (GLONASS - by liter table, nan for unknown liter)
+
+    derived(gnss, signals=None, max_gap, slip_gf, slip_mw, outlier) - two-signal combinations for all SV
+        of current time window at once, cached until the window changes (cuttime, filt, reset, refresh)
+        output: dict of arrays (epochs x SV cells): IF, IF_L - iono-free code and phase, m;
+            GF, GF_C - geometry-free phase and code, m; MW - Melbourne-Wubbena, wide-lane cycles;
+            CMC - code minus carrier, m; arc - phase arc number; slip, outlier - cycle slip and outlier flags
+
+    ingest(list_files, session_name, processes, stats=None, decimate=1, aggregate=None) - parallel conversion
+        of RINEX 3 files (process pool) and merging into one session with common time array
+
+    to_xarray(eph=True, chunk_epochs=2880) - xarray.Dataset of current time window and SV_list:
+        variables - observation and ephemeris types (time x sv), views of one array without copying;
+        coordinates sv, gnss, num, prn, fullname; dataset.to_array('observable') - time x sv x observable
+    to_dataframe(eph=True) - long pandas.DataFrame: row - SV with measurements at epoch, columns time, sv, gnss,
+        num, prn, fullname, observation and ephemeris types; measurement columns are passed without copying
+    to_arrow(eph=True, chunk_epochs=2880) - the same long table as pyarrow.Table assembled by blocks of epochs
+    to_parquet(file_name, eph=True, chunk_epochs=2880, **options) - the long table written to Parquet file
+        by blocks of epochs (row group per block), memory does not depend on session length
+        pandas, xarray and pyarrow are optional: they are imported only by these methods
     
     __parseRINEX__ - parsing RINEX files
     
@@ -57,128 +143,686 @@ Methods:
 
 """
 
-from datetime import datetime
+import bz2
+import copy
+from datetime import datetime, timedelta, timezone
+import gzip
+import hashlib
+import io
+import itertools
+import json
+import logging
 import os
-import re
 import numpy as np
 import shutil
-from scipy import interpolate
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 
 class PyGNSS:
     __pathext__ = '.pygnss'  # расширение папки
-    __obsext__ = '.obs.csv'  # расширение файлов с измерениями
-    __ephext__ = '.xyz.csv'
+    __obsext__ = '.obs.npy'  # расширение файлов с измерениями
+    __arcsext__ = '.arcs.npy'  # таблицы дуг видимости
+    __arcschunk__ = 2880  # дуги делятся на границах блоков сетки по столько эпох
+    __ephext__ = '.xyz.npy'
+    __navext__ = '.nav.npy'  # записи навигационных файлов
+    __manifest__ = 'manifest.json'  # описание содержимого папки
+    __csvext__ = ('.obs.csv', '.xyz.csv')  # расширения файлов прежнего (csv) формата
+    __compext__ = ('.gz', '.Z', '.bz2')  # расширения сжатых файлов данных
+    __version__ = 4  # версия формата папки
+    __svmax__ = {'G': 32, 'R': 32, 'E': 36}  # число ячеек под НКА в массивах ГНСС, индекс ячейки = номер - 1
+    __speed__ = 299792458.0  # скорость света, м/с
+    __omega__ = 7.2921151467e-5  # угловая скорость вращения Земли, рад/с
+    # несущие частоты по цифре вида измерений RINEX 3, Гц; ГЛОНАСС FDMA - (частота литеры 0, шаг литеры)
+    __frequency__ = {'G': {'1': 1575.42e6, '2': 1227.6e6, '5': 1176.45e6},
+                     'R': {'1': (1602e6, 0.5625e6), '2': (1246e6, 0.4375e6), '3': 1202.025e6, '4': 1600.995e6,
+                           '6': 1248.06e6},
+                     'E': {'1': 1575.42e6, '5': 1176.45e6, '6': 1278.75e6, '7': 1207.14e6, '8': 1191.795e6},
+                     'C': {'1': 1575.42e6, '2': 1561.098e6, '5': 1176.45e6, '6': 1268.52e6, '7': 1207.14e6,
+                           '8': 1191.795e6}}
 
-    def __init__(self, file_name, time_interval=30):
-        '''Creating PyGNSS object'''
-        self.path = file_name + self.__pathext__
+    def __init__(self, file_name, time_interval=30, eph_order=9, stats=None, decimate=1, aggregate=None):
+        '''Creating PyGNSS object
+        eph_order - порядок интерполяции координат НКА по узлам эфемерид
+        stats - сбор статистики стадий (self.stats): True, словарь для накопления, функция callback(стадия, запись)
+        или logging.Logger для вывода каждой записи; по умолчанию не собирается
+        decimate, aggregate - прореживание и свёртка эпох при преобразовании (как в stream), сохраняются в папке'''
+        self.path = os.path.abspath(file_name + self.__pathext__)  # не зависит от смены cwd
+        self.__statsink__ = stats if (callable(stats) or isinstance(stats, logging.Logger)) else None
+        self.stats = stats if isinstance(stats, dict) else ({} if stats else None)
 
+        # папка без manifest.json и без time.csv прежнего формата - остаток прерванного преобразования
+        if os.path.exists(self.path) and not (os.path.exists('{}/{}'.format(self.path, self.__manifest__))) and \
+                not (os.path.exists('{}/time.csv'.format(self.path))):
+            shutil.rmtree(self.path)
         # проверяем существование папки с парсеными измереними
         if not (os.path.exists(self.path)):
             # если нет, парсим файлы данных
-            if (file_name[-1] == 'o') or (file_name[-1] == 'O'):
-                # читаем RINEX 3
-                self.__parseRINEX__(file_name, time_interval)
-                # читаем эфемериды sp3
-                if os.path.exists(os.getcwd() + '/' + file_name[:-3] + 'sp3'):
-                    self.__parseEphemeris__(file_name[:-3] + 'sp3')
+            if self.__isobs__(file_name):
+                try:
+                    # читаем RINEX 3 (в т.ч. Hatanaka и сжатые)
+                    self.__parseRINEX__(file_name, time_interval, decimate, aggregate)
+                    # читаем эфемериды sp3
+                    file_sp3 = self.__findfile__(self.__splitext__(file_name)[0][:-3] + 'sp3')
+                    if file_sp3 is not None:
+                        self.__parseEphemeris__(file_sp3)
+                except BaseException:
+                    # недописанная папка не остаётся: при следующем открытии файл преобразуется заново
+                    shutil.rmtree(self.path, ignore_errors=True)
+                    raise
             elif file_name[-3:-1] == 'csv':
                 # читаем измерения GSS
                 pass
             elif file_name[-3:-1] == 'mrk':
                 # читаем измерения МРК
                 pass
+        elif (not (os.path.exists('{}/{}'.format(self.path, self.__manifest__))) or
+              self.__loadmanifest__()['version'] != self.__version__):
+            # папка создана прежней версией, переводим в текущий формат
+            time_start = time.perf_counter()
+            self.__migrate__()
+            self.__stage__('migrate', time.perf_counter() - time_start)
+        time_start = time.perf_counter()
+        self.eph_order = eph_order
         ## Открытие существующего
+        # читаются только список НКА и вектор времени, НКА создаются при первом обращении (__getattr__)
+        # массивы отображаются в память (copy-on-write): данные читаются с диска при обращении
+        self.__meta__ = self.__loadmanifest__()
         # Формирование списка НКА
-        self.SV_list_full = []
-        for filename in os.listdir(self.path):
-            if re.search(self.__obsext__, filename):
-                self.SV_list_full.append(filename[:3])
+        self.SV_list_full = list(self.__meta__['SV'])
         self.SV_list = self.SV_list_full
         # Формирование вектора времени
-        self.time = []
-        self.continious_time = []
-        file_time = open('{}/time.csv'.format(self.path))
-        for line in file_time:
-            self.time.append(datetime.fromtimestamp(float(line)))
-            self.continious_time.append(float(line))
-        self.continious_time = np.array(self.continious_time)
-        file_time.close()
-
-        # Создание атрибутов, соответствующих НКА и их заполнение
+        self.__gridtime__ = np.load('{}/time.npy'.format(self.path), mmap_mode='c')
+        self.__obs__ = {}  # измерения ГНСС по дугам видимости на всей сетке (ObsArcs)
+        # (первая эпоха, буфер интерполированных эфемерид ГНСС (эпохи x НКА x x,y,z,dt), число заполненных эпох)
+        self.__eph__ = {}
+        # (первая эпоха, буфер измерений НКА (эпохи x виды измерений), число заполненных эпох) созданных НКА
+        self.__SVbuf__ = {}
+        self.__interp__ = {}  # интерполяторы по узлам эфемерид для каждого порядка
+        self.__nav__ = {}  # бортовые эфемериды ГНСС (BroadcastEphemeris)
+        self.__SVtable__ = {}  # массивы свойств ячеек НКА для getobs
+        # окно эпох (срез сетки времени), оставшихся после cuttime; cuttime режет массивы НКА без копирования
+        self.__settime__(slice(0, None))
+        self.__stage__('open', time.perf_counter() - time_start, epochs=len(self.__gridtime__),
+                       SV=len(self.SV_list_full))
+        # файл измерений мог вырасти после преобразования (перемещённый или удалённый файл не ищется)
+        if self.__meta__.get('tail') and os.path.exists(self.path[:-len(self.__pathext__)]):
+            self.refresh()
+
+    def __getattr__(self, name):
+        # вызывается только для отсутствующих атрибутов: создание НКА при первом обращении
+        if name in self.__dict__.get('SV_list_full', ()):
+            time_start = time.perf_counter()
+            SV = self.__loadSV__(name)
+            setattr(self, name, SV)
+            self.__stage__('loadSV', time.perf_counter() - time_start, SV=1)
+            return SV
+        if (name == 'SVtable') and ('SV_list_full' in self.__dict__):
+            time_start = time.perf_counter()
+            self.SVtable = self.__makeSVtable__()
+            self.__stage__('SVtable', time.perf_counter() - time_start, SV=len(self.SVtable['name']))
+            return self.SVtable
+        raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, name))
+
+    def __stage__(self, name, duration, **counters):
+        ''' Учёт стадии в статистике: время, число вызовов и счётчики суммируются в self.stats[name],
+        запись вызова передаётся в callback или logging. Без статистики ничего не делается'''
+        stats = getattr(self, 'stats', None)
+        if stats is None:
+            return
+        record = stats.setdefault(name, {'calls': 0, 'time': 0.0})
+        record['calls'] += 1
+        record['time'] += duration
+        for key, value in counters.items():
+            record[key] = record.get(key, 0) + value
+        sink = self.__statsink__
+        if isinstance(sink, logging.Logger):
+            sink.info('%s: %.6f s %s', name, duration, counters)
+        elif sink is not None:
+            sink(name, dict(counters, time=duration))
+
+    def __SVinfo__(self, SV_name):
+        ''' Словарь с невекторными свойствами НКА'''
+        SV = {'name': SV_name, 'num': int(SV_name[1:])}  # имя и номер НКА
+        # заполнение литер, ГНСС и полных имён
+        if SV_name[0] == 'G':
+            SV['gnss'] = 'G'
+            SV['prn'] = SV['num']
+            SV['fullname'] = SV['name']
+        elif SV_name[0] == 'R':
+            SV['gnss'] = 'R'
+            # подтягивание номера литеры
+            litertable = self.__meta__['litertable']
+            SV['prn'] = litertable[SV['num'] - 1] if SV['num'] <= len(litertable) else None
+            if SV['prn'] is None:
+                SV['prn'] = np.nan
+            SV['fullname'] = '{}({:+2})'.format(SV['name'], SV['prn'])
+        elif SV_name[0] == 'E':
+            SV['gnss'] = 'E'
+            SV['prn'] = SV['num']
+            SV['fullname'] = SV['name']
+        return SV
+
+    def __makeSVtable__(self):
+        ''' Таблица свойств НКА из SV_list_full по столбцам (numpy-массивы, строка - НКА):
+        name, gnss, num, prn (nan - литера неизвестна), fullname,
+        first, last - метки времени первой и последней эпохи с измерениями (по всей сетке, nan - нет),
+        obs - наличие видов измерений (НКА x obs_types), obs_types - виды измерений всех ГНСС'''
+        list_info = [self.__SVinfo__(SV_name) for SV_name in self.SV_list_full]
+        table = {key: np.array([info[key] for info in list_info], dtype=dtype)
+                 for key, dtype in (('name', 'U3'), ('gnss', 'U1'), ('num', int), ('prn', float), ('fullname', str))}
+        obs_types = []
+        for gnss in sorted(self.__meta__['obs_types']):
+            obs_types.extend(obs_type for obs_type in self.__meta__['obs_types'][gnss] if not (obs_type in obs_types))
+        table['obs_types'] = obs_types
+        table['obs'] = np.zeros((len(list_info), len(obs_types)), dtype=bool)
+        table['first'] = np.full(len(list_info), np.nan)
+        table['last'] = np.full(len(list_info), np.nan)
+        # границы видимости - по таблицам дуг, виды измерений - один проход по строкам измерений
+        for gnss in set(table['gnss']):
+            rows = np.flatnonzero(table['gnss'] == gnss)
+            cells = table['num'][rows] - 1
+            present, first, last = self.__obsarcs__(gnss).summary()  # вся сетка, без окна cuttime
+            ind_types = [obs_types.index(obs_type) for obs_type in self.__meta__['obs_types'][gnss]]
+            table['obs'][rows[:, None], ind_types] = present[cells]
+            ind = first[cells] >= 0
+            table['first'][rows[ind]] = self.__gridtime__[first[cells][ind]]
+            table['last'][rows[ind]] = self.__gridtime__[last[cells][ind]]
+        return table
+
+    def __loadSV__(self, SV_name, start=None):
+        ''' Создание словаря НКА: измерения собираются из дуг НКА в окне эпох, эфемериды - срезы массивов ГНСС,
+        свойства. start - номер эпохи сетки, с которой в буфер измерений НКА дописываются новые строки (refresh),
+        прежние строки не собираются заново'''
+        gnss, num_SV = SV_name[0], int(SV_name[1:]) - 1
         # Чтение информации о наблюдениях
+        window_start, window_stop, _ = self.__timeind__.indices(len(self.__gridtime__))
+        cached = self.__SVbuf__.get(SV_name)
+        if (start is None) or (cached is None) or (cached[0] > window_start) or \
+                not (cached[0] <= start <= cached[0] + cached[2]):
+            block = self.__obsarcs__(gnss).dense(self.__timeind__, num_SV)
+            cached = (window_start, block, len(block))
+        else:
+            block = self.__obsarcs__(gnss).dense(slice(start, window_stop), num_SV)
+            keep = start - cached[0]
+            buffer = self.__growbuffer__(cached[1], keep + len(block), keep)
+            buffer[keep:keep + len(block)] = block
+            cached = (cached[0], buffer, keep + len(block))
+        self.__SVbuf__[SV_name] = cached
+        SVdata = cached[1][window_start - cached[0]:cached[2]]
+        SV = {obs_type: SVdata[:, k] for k, obs_type in enumerate(self.__meta__['obs_types'][gnss])}
+        SV.update(self.__SVinfo__(SV_name))
+        # Чтение информации об эфемеридах
+        if SV_name in self.__meta__['SV_eph']:
+            block = self.__ephblock__(gnss)
+            for k, eph_type in enumerate(self.__meta__['eph_types']):
+                SV[eph_type] = block[:, num_SV, k]
+        return SV
+
+    def __obsarcs__(self, gnss):
+        ''' Измерения ГНСС по дугам видимости на всей сетке (ObsArcs), строки отображаются в память
+        при первом обращении'''
+        arcs = self.__obs__.get(gnss)
+        if arcs is None:
+            arcs = self.__obs__[gnss] = ObsArcs(
+                np.load('{}/{}{}'.format(self.path, gnss, self.__arcsext__)),
+                np.load('{}/{}{}'.format(self.path, gnss, self.__obsext__), mmap_mode='c'),
+                (len(self.__gridtime__), self.__meta__['SV_max'][gnss], len(self.__meta__['obs_types'][gnss])))
+        return arcs
+
+    def __obsblock__(self, gnss, start=0, stop=None):
+        ''' Плотный массив измерений ГНСС (эпохи x НКА x виды измерений, nan вне дуг) эпох start:stop окна,
+        собирается из дуг при каждом вызове'''
+        window_start, window_stop, _ = self.__timeind__.indices(len(self.__gridtime__))
+        stop = window_stop if stop is None else min(window_start + stop, window_stop)
+        return self.__obsarcs__(gnss).dense(slice(window_start + start, stop))
+
+    def __ephblock__(self, gnss):
+        ''' Массив эфемерид ГНСС в окне эпох (эпохи x НКА x x,y,z,dt), интерполируется для всех НКА сразу
+        при первом обращении; для окна внутри уже интерполированного возвращается срез'''
+        start, stop, _ = self.__timeind__.indices(len(self.__gridtime__))
+        cached = self.__eph__.get(gnss)
+        if (cached is None) or (cached[0] > start) or (cached[0] + cached[2] < stop):
+            block = self.interpolate(self.__gridtime__[start:stop], gnss)
+            cached = self.__eph__[gnss] = (start, block, len(block))
+        return cached[1][start - cached[0]:stop - cached[0]]
+
+    @staticmethod
+    def __growbuffer__(buffer, size, keep):
+        ''' Буфер с запасом по первой оси для дописываемых эпох: если в buffer нет места под size строк,
+        создаётся вдвое больший (не меньше size), из прежнего переносятся первые keep строк'''
+        if size <= len(buffer):
+            return buffer
+        grown = np.full((max(size, 2 * len(buffer)),) + buffer.shape[1:], np.nan)
+        grown[:keep] = buffer[:keep]
+        return grown
+
+    def __settime__(self, window, cut=None, start=None):
+        ''' Установка окна эпох window (срез сетки времени): вектор времени и словари созданных НКА.
+        cut - срез прежнего окна: массивы НКА режутся без копирования, без cut - собираются заново;
+        start - окно продлено (refresh): в массивы НКА дописываются эпохи сетки с start'''
+        self.__timeind__ = window
+        self.__derived__ = {}  # комбинации измерений считаются заново для нового окна
+        self.continious_time = self.__gridtime__[window]
+        self.time = TimeAxis(self.continious_time)
         for SV_name in self.SV_list_full:
-            file_SVobs = open('{}/{}{}'.format(self.path, SV_name, self.__obsext__))
-            flag_firstline = True
-            num_obs = 0
-            for line in file_SVobs:
-                if flag_firstline:
-                    flag_firstline = False
-                    # создание атрибутов у каждого SV
-                    obs_types = line.strip().split(';')
-                    SV = dict.fromkeys(obs_types)
-                    for key in SV:
-                        SV[key] = np.nan * np.arange(len(self.time))
-                    SV['name'] = SV_name  # имя НКА
-                    SV['num'] = int(SV_name[1:])  # номер НКА
-                    # заполнение литер, ГНСС и полных имён
-                    if SV_name[0] == 'G':
-                        SV['gnss'] = 'G'
-                        SV['prn'] = SV['num']
-                        SV['fullname'] = SV['name']
-                    elif SV_name[0] == 'R':
-                        SV['gnss'] = 'R'
-                        # подтягивание номера литеры
-                        file_prntable = open(self.path + '/litertable.csv')
-                        for count in range(SV['num'] - 1):
-                            file_prntable.readline()
-                        SV['prn'] = float(file_prntable.readline())
-                        if not(np.isnan(SV['prn'])):
-                            SV['prn']=int(SV['prn'])
-                        file_prntable.close()
-                        SV['fullname'] = '{}({:+2})'.format(SV['name'], SV['prn'])
-                    elif SV_name[0] == 'E':
-                        SV['gnss'] = 'E'
-                        SV['prn'] = SV['num']
-                        SV['fullname'] = SV['name']
+            if not (SV_name in self.__dict__):
+                continue
+            SV = self.__dict__[SV_name]
+            if cut is not None:
+                for key, value in SV.items():
+                    if isinstance(value, np.ndarray):
+                        SV[key] = value[cut]
+                continue
+            SVnew = self.__loadSV__(SV_name, start)
+            for key in SV.keys():
+                if key in SVnew:
+                    SV[key] = SVnew[key]
 
-                else:
-                    dat = line.strip().split(';')
-                    for k in range(len(dat) - 1):
-                        SV[obs_types[k]][num_obs] = np.nan if dat[k] == '' else float(dat[k])
-                    num_obs += 1
-            file_SVobs.close()
-
-            # Чтение информации об эфемеридах
-            if os.path.exists('{}/{}{}'.format(self.path, SV_name, self.__ephext__)):
-                file_SVeph = open('{}/{}{}'.format(self.path, SV_name, self.__ephext__))
-                flag_firstline = True
-                num_obs = 0
-                for line in file_SVeph:
-                    if flag_firstline:
-                        flag_firstline = False
-                        # создание атрибутов у каждого SV
-                        eph_types = line.strip().split(';')
-                        SV_eph = dict.fromkeys(eph_types)
-                        for key in SV_eph:
-                            SV_eph[key] = np.nan * np.arange(len(self.time))
+    def __timewindow__(self, start_time, end_time, window):
+        ''' Срез сетки времени с эпохами окна window от start_time до end_time включительно
+        (datetime, float или None - без ограничения), границы ищутся бинарным поиском'''
+        start, stop, _ = window.indices(len(self.__gridtime__))
+        vct_timestamp = self.__gridtime__[window]
+        if isinstance(start_time, datetime):
+            start_time = start_time.timestamp()
+        if isinstance(end_time, datetime):
+            end_time = end_time.timestamp()
+        ind_start = 0 if start_time is None else int(np.searchsorted(vct_timestamp, start_time, 'left'))
+        ind_stop = len(vct_timestamp) if end_time is None else int(np.searchsorted(vct_timestamp, end_time, 'right'))
+        ind_stop = max(ind_stop, ind_start)
+        if (end_time is None) and (window.stop is None):
+            return slice(start + ind_start, None), slice(ind_start, None)  # окно растёт вместе с файлом (refresh)
+        return slice(start + ind_start, start + ind_stop), slice(ind_start, ind_stop)
+
+    def interpolate(self, time_query, gnss, order=None, source=None):
+        ''' Интерполяция эфемерид ГНСС на произвольные моменты времени (float или datetime).
+        time_query - (моменты) общие для всех НКА или (моменты x НКА) - свои для каждого НКА,
+        например моменты излучения сигнала.
+        source - 'sp3' или 'nav', по умолчанию sp3, а без него - бортовые эфемериды навигационных файлов.
+        sp3: координаты - полиномом Лагранжа порядка order (по умолчанию eph_order), часы - линейно;
+        nav: расчёт по ближайшей записи НКА (BroadcastEphemeris), order не используется.
+        :return: массив (моменты x НКА x x,y,z,dt), вне узлов и у пропусков в узлах - nan'''
+        if isinstance(time_query, datetime) or (isinstance(time_query, (list, tuple)) and time_query and
+                                                isinstance(time_query[0], datetime)):
+            time_query = [timestamp.timestamp() for timestamp in np.atleast_1d(time_query).tolist()]
+        time_query = np.asarray(time_query, dtype=float)
+        time_start = time.perf_counter()
+        if source is None:
+            source = 'sp3' if os.path.exists('{}/{}{}'.format(self.path, gnss, self.__ephext__)) else 'nav'
+        if (source == 'nav') and os.path.exists('{}/{}{}'.format(self.path, gnss, self.__navext__)):
+            if not (gnss in self.__nav__):
+                self.__nav__[gnss] = BroadcastEphemeris(
+                    np.load('{}/{}{}'.format(self.path, gnss, self.__navext__)), gnss)
+            result = self.__nav__[gnss](time_query, self.__meta__['SV_max'][gnss])
+            self.__stage__('interpolate', time.perf_counter() - time_start, moments=time_query.size)
+            return result
+        if (source == 'nav') or not (os.path.exists('{}/{}{}'.format(self.path, gnss, self.__ephext__))):
+            shape = time_query.shape + (self.__meta__['SV_max'][gnss],) if time_query.ndim == 1 else time_query.shape
+            return np.full(shape + (len(self.__meta__['eph_types']),), np.nan)
+        nodes = np.load('{}/{}{}'.format(self.path, gnss, self.__ephext__))  # узлов немного, читаются целиком
+        result = []
+        for order, comp in ((order or self.eph_order, slice(0, 3)), (1, slice(3, None))):
+            if not (order in self.__interp__):
+                self.__interp__[order] = LagrangeInterpolator(np.load('{}/ephtime.npy'.format(self.path)), order)
+            result.append(self.__interp__[order](nodes[:, :, comp], time_query))
+        self.__stage__('interpolate', time.perf_counter() - time_start, moments=time_query.size)
+        return np.concatenate(result, axis=-1)
+
+    def spp(self, obs_type='C1C', gnss=None, elevation_mask=10, iterations=10, chunk_epochs=2880):
+        ''' Одноточечное решение (SPP) по псевдодальностям для всех эпох окна сразу:
+        взвешенный МНК (вес sin^2 угла места) блоками по chunk_epochs эпох, отсутствующие НКА маскируются.
+        obs_type - вид измерений или словарь {ГНСС: вид измерений}; gnss - ГНСС решения (по умолчанию все,
+        для которых есть измерения и эфемериды), для каждой ГНСС оценивается своё смещение часов.
+        Используются НКА из SV_list. Учитываются часы НКА, время распространения и вращение Земли,
+        тропосфера - простой моделью 2,3 м / sin(угла места); ионосфера и релятивистская поправка не учитываются.
+        :return: словарь массивов по эпохам окна:
+            x, y, z - координаты приёмника, км; coordinates - матрица (эпохи x 3)
+            dt - {ГНСС: смещение часов приёмника, мкс}
+            GDOP, PDOP, HDOP, VDOP; TDOP - {ГНСС: TDOP}
+            num - число НКА в решении
+        Эпохи, где решение невозможно, - nan'''
+        time_start = time.perf_counter()
+        if isinstance(obs_type, str):
+            obs_type = {temp: obs_type for temp in self.__svmax__}
+        list_gnss = [temp for temp in (gnss or sorted(self.__svmax__))
+                     if (obs_type.get(temp) in self.__meta__['obs_types'].get(temp, [])) and
+                     any(SV_name[0] == temp for SV_name in self.__meta__['SV_eph']) and
+                     any(SV_name[0] == temp for SV_name in self.SV_list)]
+        size = len(self.continious_time)
+        result = {'coordinates': np.full((size, 3), np.nan), 'num': np.zeros(size, dtype=int),
+                  'dt': {temp: np.full(size, np.nan) for temp in list_gnss},
+                  'TDOP': {temp: np.full(size, np.nan) for temp in list_gnss}}
+        result.update((key, np.full(size, np.nan)) for key in ('GDOP', 'PDOP', 'HDOP', 'VDOP'))
+        if not list_gnss:
+            print('No pseudoranges with ephemeris for SPP')
+            return result
+        # ячейки НКА всех ГНСС подряд: номер ГНСС ячейки и признак наличия НКА в SV_list
+        gnss_cell = np.concatenate([np.full(self.__svmax__[temp], num) for num, temp in enumerate(list_gnss)])
+        onehot = (gnss_cell[:, None] == np.arange(len(list_gnss))).astype(float)  # ячейки x ГНСС
+        in_list = np.zeros(len(gnss_cell), dtype=bool)
+        offset = dict(zip(list_gnss, np.cumsum([0] + [self.__svmax__[temp] for temp in list_gnss])))
+        for SV_name in self.SV_list:
+            if SV_name[0] in offset:
+                in_list[offset[SV_name[0]] + int(SV_name[1:]) - 1] = True
+        num_unknown = 3 + len(list_gnss)
+        sin_mask = np.sin(np.radians(elevation_mask))
+        pos_last = np.zeros(3)
+
+        for start in range(0, size, chunk_epochs):
+            vct_time = self.continious_time[start:start + chunk_epochs]
+            ## Псевдодальности и положения НКА на момент излучения
+            list_range, list_sat = [], []
+            for temp in list_gnss:
+                # измерения собираются из дуг только для эпох блока
+                pseudorange = self.__obsblock__(temp, start, start + chunk_epochs)[
+                    :, :, self.__meta__['obs_types'][temp].index(obs_type[temp])]
+                time_tx = vct_time[:, None] - pseudorange / self.__speed__
+                # часы НКА - для уточнения момента излучения (координаты здесь не нужны, порядок 1)
+                sat = self.interpolate(time_tx, temp, order=1)
+                sat = self.interpolate(time_tx - sat[:, :, 3] * 1e-6, temp)
+                list_range.append(pseudorange + sat[:, :, 3] * 1e-6 * self.__speed__)
+                list_sat.append(sat[:, :, :3] * 1e3)
+            pseudorange = np.concatenate(list_range, axis=1)  # эпохи x ячейки, м
+            sat = np.concatenate(list_sat, axis=1)  # эпохи x ячейки x 3, м
+            valid = in_list & ~np.isnan(pseudorange) & ~np.isnan(sat).any(axis=2)
+            # на каждой эпохе ячейки с измерениями - в начало, остальные отбрасываются
+            cells = np.argsort(~valid, axis=1, kind='stable')[:, :max(valid.sum(axis=1).max(initial=0), 1)]
+            valid = np.take_along_axis(valid, cells, axis=1)
+            pseudorange = np.where(valid, np.take_along_axis(pseudorange, cells, axis=1), 0)
+            sat = np.where(valid[:, :, None], np.take_along_axis(sat, cells[:, :, None], axis=1), 0)
+            gnss_onehot = onehot[cells]  # эпохи x ячейки x ГНСС
+
+            ## Итерации МНК для всех эпох блока
+            # начальное приближение - последнее решение предыдущего блока (или центр Земли)
+            pos = np.zeros((len(vct_time), 3)) + pos_last
+            clock = np.zeros((len(vct_time), len(list_gnss)))
+            angle = np.zeros(pseudorange.shape)  # поворот Земли за время распространения
+            for _ in range(iterations):
+                sat_rot = np.stack((sat[:, :, 0] * np.cos(angle) + sat[:, :, 1] * np.sin(angle),
+                                    sat[:, :, 1] * np.cos(angle) - sat[:, :, 0] * np.sin(angle), sat[:, :, 2]), axis=2)
+                los = sat_rot - pos[:, None, :]
+                distance = np.linalg.norm(los, axis=2)
+                distance[~valid] = 1
+                los /= distance[:, :, None]
+                angle = self.__omega__ * distance / self.__speed__
+                # угол места и тропосфера - когда положение уже у поверхности Земли
+                radius = np.linalg.norm(pos, axis=1)
+                known = radius > 6e6
+                sin_elev = np.einsum('esk,ek->es', los, pos / np.maximum(radius, 1)[:, None])
+                use = valid & (~known[:, None] | (sin_elev >= sin_mask))
+                weight = np.where(known[:, None], np.maximum(sin_elev, 0.1) ** 2, 1) * use
+                tropo = np.where(known[:, None], 2.3 / np.maximum(sin_elev, 0.1), 0)
+                residual = (pseudorange - distance - np.einsum('eg,esg->es', clock, gnss_onehot) - tropo) * use
+                design = np.concatenate((-los, gnss_onehot), axis=2) * use[:, :, None]
+                normal = np.matmul(design.transpose(0, 2, 1) * weight[:, None, :], design)
+                rhs = np.einsum('esk,es->ek', design, weight * residual)
+                # ГНСС без НКА на эпохе: смещение часов не оценивается
+                count = np.einsum('es,esg->eg', use.astype(float), gnss_onehot)
+                ind = np.arange(3, num_unknown)
+                normal[:, ind, ind] += count == 0
+                solvable = use.sum(axis=1) >= 3 + (count > 0).sum(axis=1)
+                normal[~solvable] = np.eye(num_unknown)
+                delta = np.linalg.solve(normal, rhs[:, :, None])[:, :, 0]
+                delta[~solvable] = 0
+                pos += delta[:, :3]
+                clock += delta[:, 3:]
+                if known.all() and (np.abs(delta).max(initial=0) < 1e-4):
+                    break
+
+            ## Результаты и DOP
+            rows = slice(start, start + len(vct_time))
+            normal = np.matmul(design.transpose(0, 2, 1), design)
+            normal[:, ind, ind] += count == 0
+            normal[~solvable] = np.eye(num_unknown)
+            cov = np.linalg.inv(normal)
+            cov[~solvable] = np.nan
+            # поворот в местную систему (восток, север, верх)
+            lat = np.arctan2(pos[:, 2], np.hypot(pos[:, 0], pos[:, 1]))
+            lon = np.arctan2(pos[:, 1], pos[:, 0])
+            rot = np.stack((np.stack((-np.sin(lon), np.cos(lon), np.zeros(len(lon))), axis=1),
+                            np.stack((-np.sin(lat) * np.cos(lon), -np.sin(lat) * np.sin(lon), np.cos(lat)), axis=1),
+                            np.stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)), axis=1)),
+                           axis=1)
+            cov_enu = np.einsum('eij,ejk,elk->eil', rot, cov[:, :3, :3], rot)
+            if solvable.any():
+                pos_last = pos[solvable][-1]
+            pos[~solvable] = np.nan
+            result['coordinates'][rows] = pos * 1e-3
+            result['num'][rows] = use.sum(axis=1) * solvable
+            # смещения часов ГНСС без НКА на эпохе в GDOP не входят
+            result['GDOP'][rows] = np.sqrt(np.trace(cov[:, :3, :3], axis1=1, axis2=2) +
+                                           (cov[:, ind, ind] * (count > 0)).sum(axis=1))
+            result['PDOP'][rows] = np.sqrt(np.trace(cov[:, :3, :3], axis1=1, axis2=2))
+            result['HDOP'][rows] = np.sqrt(cov_enu[:, 0, 0] + cov_enu[:, 1, 1])
+            result['VDOP'][rows] = np.sqrt(cov_enu[:, 2, 2])
+            for num, temp in enumerate(list_gnss):
+                no_SV = ~solvable | (count[:, num] == 0)
+                result['dt'][temp][rows] = np.where(no_SV, np.nan, clock[:, num] / self.__speed__ * 1e6)
+                result['TDOP'][temp][rows] = np.where(no_SV, np.nan, np.sqrt(cov[:, 3 + num, 3 + num]))
+        for num, key in enumerate(('x', 'y', 'z')):
+            result[key] = result['coordinates'][:, num]
+        self.__stage__('spp', time.perf_counter() - time_start, epochs=size,
+                       solved=int(np.count_nonzero(result['num'])))
+        return result
+
+    def frequency(self, gnss, obs_type):
+        ''' Несущие частоты вида измерений (или сигнала '1C', или цифры частоты) для всех ячеек НКА ГНСС, Гц:
+        ГЛОНАСС FDMA - по таблице литер, у НКА без литеры - nan'''
+        band = obs_type[1] if len(obs_type) == 3 else obs_type[0]
+        value = self.__frequency__[gnss][band]
+        if not isinstance(value, tuple):
+            return np.full(self.__meta__['SV_max'][gnss], value)
+        liters = self.__meta__['litertable'][:self.__meta__['SV_max'][gnss]]
+        liters = np.array([np.nan if prn is None else prn for prn in liters], dtype=float)
+        liters = np.concatenate((liters, np.full(self.__meta__['SV_max'][gnss] - len(liters), np.nan)))
+        return value[0] + value[1] * liters
+
+    def derived(self, gnss, signals=None, max_gap=None, slip_gf=0.05, slip_mw=4.0, outlier=5.0):
+        ''' Комбинации измерений двух сигналов ГНСС для всех НКА окна эпох одним проходом,
+        словарь массивов (эпохи x ячейки НКА):
+            IF, IF_L - ионосферно-свободные комбинации кода и фазы, м
+            GF, GF_C - геометрически-свободные комбинации фазы (L1 - L2) и кода (P2 - P1), м
+            MW - комбинация Мельбурна-Вюббены, циклы широкой полосы
+            CMC - код минус фаза первого сигнала, м
+            arc - номер непрерывной дуги фазы в ячейке НКА (-1 - нет измерений или выброс)
+            slip - скачок фазы (первая эпоха новой дуги), outlier - выброс (одиночный скачок CMC или MW с возвратом)
+        signals - пара сигналов, например ('1C', '2W'), по умолчанию - первые два сигнала разных частот
+        с кодом и фазой; частоты ГЛОНАСС - по литерам.
+        Дуга прерывается на пропуске дольше max_gap секунд (по умолчанию 10 интервалов), на скачке MW больше
+        slip_mw циклов или на отклонении GF от линейного прогноза по двум прошлым эпохам дуги больше slip_gf м.
+        Выброс - скачок CMC больше outlier м или MW больше slip_mw циклов, отменяемый на следующей эпохе.
+        Результат запоминается до изменения окна эпох (cuttime, filt, reset, refresh)'''
+        key = (gnss, signals and tuple(signals), max_gap, slip_gf, slip_mw, outlier)
+        if key in self.__derived__:
+            return self.__derived__[key]
+        time_start = time.perf_counter()
+        obs_types = self.__meta__['obs_types'].get(gnss, [])
+        if signals is None:
+            list_signals = [obs_type[1:] for obs_type in obs_types
+                            if (obs_type[0] == 'C') and ('L' + obs_type[1:] in obs_types)]
+            signals = list_signals[:1] + [signal for signal in list_signals if list_signals[0][0] != signal[0]][:1]
+        if (len(signals) != 2) or any(not ({'C' + signal, 'L' + signal} <= set(obs_types)) for signal in signals):
+            raise ValueError('No code and phase of two signals for {}'.format(gnss))
+        block = self.__obsblock__(gnss)
+        code = [np.array(block[:, :, obs_types.index('C' + signal)]) for signal in signals]
+        freq = [self.frequency(gnss, signal) for signal in signals]
+        phase = [block[:, :, obs_types.index('L' + signal)] * (self.__speed__ / f) for signal, f in zip(signals, freq)]
+        f1, f2 = freq
+        result = {'IF': (f1 ** 2 * code[0] - f2 ** 2 * code[1]) / (f1 ** 2 - f2 ** 2),
+                  'IF_L': (f1 ** 2 * phase[0] - f2 ** 2 * phase[1]) / (f1 ** 2 - f2 ** 2),
+                  'GF': phase[0] - phase[1], 'GF_C': code[1] - code[0],
+                  'MW': ((f1 * phase[0] - f2 * phase[1]) / (f1 - f2) - (f1 * code[0] + f2 * code[1]) / (f1 + f2)) /
+                        (self.__speed__ / (f1 - f2)),
+                  'CMC': code[0] - phase[0]}
+        result.update(self.__arcs__(result, max_gap or 10 * self.__meta__['time_interval'], slip_gf, slip_mw, outlier))
+        self.__derived__[key] = result
+        self.__stage__('derived', time.perf_counter() - time_start, epochs=len(self.continious_time))
+        return result
+
+    def __arcs__(self, comb, max_gap, slip_gf, slip_mw, outlier):
+        ''' Дуги, скачки и выбросы по комбинациям GF, MW, CMC: сравнение с соседними эпохами с измерениями
+        в каждой ячейке НКА выполняется для всех эпох сразу'''
+        vct_time = self.continious_time
+        size = len(vct_time)
+        rows = np.arange(size)[:, None]
+
+        def neighbours(valid):
+            # номера предыдущей и следующей эпохи с измерениями (-1 и size - нет)
+            prev = np.maximum.accumulate(np.where(valid, rows, -1), axis=0)
+            nxt = np.minimum.accumulate(np.where(valid, rows, size)[::-1], axis=0)[::-1]
+            return (np.concatenate((np.full((1, valid.shape[1]), -1), prev[:-1])),
+                    np.concatenate((nxt[1:], np.full((1, valid.shape[1]), size))))
+
+        def take(values, ind):
+            return np.take_along_axis(values, np.clip(ind, 0, size - 1), axis=0)
+
+        def linked(ind):
+            # соседняя эпоха есть и не дальше max_gap
+            return (ind >= 0) & (ind < size) & (np.abs(vct_time[np.clip(ind, 0, size - 1)] - vct_time[:, None]) <= max_gap)
+
+        valid = ~np.isnan(comb['GF']) & ~np.isnan(comb['MW']) & ~np.isnan(comb['CMC'])
+        # выбросы: скачок на эпохе и возврат на следующей при согласованных соседях
+        prev, nxt = neighbours(valid)
+        spike = np.zeros(valid.shape, dtype=bool)
+        for name, threshold in (('CMC', outlier), ('MW', slip_mw)):
+            values = comb[name]
+            before, after = take(values, prev), take(values, nxt)
+            spike |= ((np.abs(values - before) > threshold) & (np.abs(after - values) > threshold) &
+                      (np.abs(after - before) <= threshold))
+        spike &= valid & linked(prev) & linked(nxt)
+        valid &= ~spike
+
+        ## Скачки по соседним эпохам без выбросов
+        prev = neighbours(valid)[0]
+        prev2 = take(prev, prev)
+        time_prev = vct_time[np.clip(prev, 0, size - 1)]
+        time_prev2 = vct_time[np.clip(prev2, 0, size - 1)]
+        gap = ~linked(prev)
+        gap2 = gap | (prev2 < 0) | (time_prev - time_prev2 > max_gap)  # нет двух прошлых эпох дуги
+        # GF: отклонение от линейного прогноза по двум прошлым эпохам дуги (ионосфера меняется плавно),
+        # в начале дуги и после скачка на прошлой эпохе проверяется только MW
+        GF = comb['GF']
+        GF_prev = take(GF, prev)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            predict = GF_prev + (GF_prev - take(GF, prev2)) * (vct_time[:, None] - time_prev) / (time_prev - time_prev2)
+        jump_gf = ~gap2 & (np.abs(GF - predict) > slip_gf)
+        jump_gf &= ~take(jump_gf, prev)
+        jump = (jump_gf | (np.abs(comb['MW'] - take(comb['MW'], prev)) > slip_mw)) & valid & ~gap
+        start = valid & (gap | jump)
+        return {'arc': np.where(valid, np.cumsum(start, axis=0) - 1, -1), 'slip': jump, 'outlier': spike}
+
+    def __loadmanifest__(self):
+        with open('{}/{}'.format(self.path, self.__manifest__)) as file_manifest:
+            return json.load(file_manifest)
+
+    def __savemanifest__(self, manifest):
+        with open('{}/{}'.format(self.path, self.__manifest__), 'w') as file_manifest:
+            json.dump(manifest, file_manifest, indent=1)
+
+    def __migrate__(self):
+        ''' Перевод папки прежних форматов в текущий; файлы прежнего формата после записи удаляются:
+        csv - time.csv, litertable.csv, <SV>.obs.csv, <SV>.xyz.csv
+        версия 1 - manifest.json, time.npy, <SV>.obs.npy, <SV>.xyz.npy
+        версия 2 - эфемериды на сетке измерений, <G>.xyz.npy (эпохи x НКА x x,y,z,dt)
+        версия 3 - плотные массивы измерений, <G>.obs.npy (эпохи x НКА x виды измерений)'''
+        if not (os.path.exists('{}/{}'.format(self.path, self.__manifest__))) or (
+                self.__loadmanifest__()['version'] == 1):
+            self.__migrate1__()
+        manifest = self.__loadmanifest__()
+        if not ('time_interval' in manifest):
+            # шаг сетки в папках до потокового чтения не хранился - по вектору времени
+            vct_step = np.diff(np.load('{}/time.npy'.format(self.path)))
+            manifest['time_interval'] = float(np.round(np.median(vct_step), 6)) if len(vct_step) else 30.0
+            self.__savemanifest__(manifest)
+        if manifest['version'] == 2:
+            # узлы эфемерид - эпохи сетки, на которых есть значения
+            vct_timestamp = np.load('{}/time.npy'.format(self.path))
+            dict_block = {gnss: np.load('{}/{}{}'.format(self.path, gnss, self.__ephext__))
+                          for gnss in self.__svmax__ if os.path.exists('{}/{}{}'.format(self.path, gnss, self.__ephext__))}
+            if dict_block:
+                ind = np.flatnonzero(np.any([~np.isnan(block).all(axis=(1, 2)) for block in dict_block.values()], axis=0))
+                np.save('{}/ephtime.npy'.format(self.path), vct_timestamp[ind])
+                for gnss, block in dict_block.items():
+                    np.save('{}/{}{}'.format(self.path, gnss, self.__ephext__), block[ind])
+            manifest['version'] = 3
+            self.__savemanifest__(manifest)
+        if manifest['version'] == 3:
+            # плотные массивы измерений - в дуги видимости, блоками эпох
+            for gnss in self.__svmax__:
+                file_obs = '{}/{}{}'.format(self.path, gnss, self.__obsext__)
+                if not (os.path.exists(file_obs)):
+                    continue
+                block = np.load(file_obs, mmap_mode='r')
+                list_arcs = [np.zeros((0, 4), dtype=np.int64)]
+                list_rows = [np.zeros((0, block.shape[2]))]
+                offset = 0
+                for num_obs in range(0, len(block), self.__arcschunk__):
+                    arcs, rows = ObsArcs.pack(np.asarray(block[num_obs:num_obs + self.__arcschunk__]), num_obs, offset)
+                    list_arcs.append(arcs)
+                    list_rows.append(rows)
+                    offset += len(rows)
+                del block
+                np.save('{}/{}{}'.format(self.path, gnss, self.__arcsext__), np.concatenate(list_arcs))
+                np.save(file_obs, np.concatenate(list_rows))
+            manifest['version'] = 4
+            self.__savemanifest__(manifest)
+
+    def __migrate1__(self):
+        ''' Перевод папок csv и версии 1 в версию 2'''
+        dict_SVdata = [{}, {}]  # массивы измерений и эфемерид (эпохи x виды) по НКА
+        if os.path.exists('{}/{}'.format(self.path, self.__manifest__)):
+            manifest = self.__loadmanifest__()
+            vct_timestamp = np.load('{}/time.npy'.format(self.path))
+            for SV_name in manifest['SV']:
+                dict_SVdata[0][SV_name] = np.load('{}/{}{}'.format(self.path, SV_name, self.__obsext__))
+            for SV_name in manifest['SV_eph']:
+                dict_SVdata[1][SV_name] = np.load('{}/{}{}'.format(self.path, SV_name, self.__ephext__))
+            list_old = ['{}{}'.format(SV_name, self.__obsext__) for SV_name in manifest['SV']] + [
+                '{}{}'.format(SV_name, self.__ephext__) for SV_name in manifest['SV_eph']]
+        else:
+            vct_timestamp = np.loadtxt('{}/time.csv'.format(self.path), ndmin=1)
+            prntable = np.loadtxt('{}/litertable.csv'.format(self.path), ndmin=1)
+            manifest = {'obs_types': {}, 'eph_types': [],
+                        'litertable': [None if np.isnan(prn) else int(prn) for prn in prntable]}
+            list_old = ['time.csv', 'litertable.csv']
+            for file_csv in sorted(os.listdir(self.path)):
+                for num_ext, csvext in enumerate(self.__csvext__):
+                    if not file_csv.endswith(csvext):
+                        continue
+                    SV_name = file_csv[:3]
+                    file_SV = open('{}/{}'.format(self.path, file_csv))
+                    types = file_SV.readline().strip().split(';')
+                    SVdata = np.full((len(vct_timestamp), len(types)), np.nan)
+                    for num_obs, line in enumerate(file_SV):
+                        dat = line.strip().split(';')[:len(types)]
+                        SVdata[num_obs, :len(dat)] = [np.nan if obs == '' else float(obs) for obs in dat]
+                    file_SV.close()
+                    dict_SVdata[num_ext][SV_name] = SVdata
+                    if num_ext == 0:
+                        manifest['obs_types'][SV_name[0]] = types
                     else:
-                        dat = line.strip().split(';')
-                        for k in range(len(dat)):
-                            SV_eph[eph_types[k]][num_obs] = np.nan if dat[k] == '' else float(dat[k])
-                        num_obs += 1
-                file_SVeph.close()
-                # интерполяция пропусков
-                for eph_type in eph_types:
-                    ind = ~(np.isnan(SV_eph[eph_type]))
-                    f_interp = interpolate.interp1d(self.continious_time[ind], SV_eph[eph_type][ind],
-                                                    bounds_error=False, kind='cubic')
-                    SV_eph[eph_type] = f_interp(self.continious_time)
-
-                SV.update(SV_eph)  # добавляем словарь с эфемеридами в основной словарь SV
-
-            setattr(self, SV_name, SV)
+                        manifest['eph_types'] = types
+                    list_old.append(file_csv)
+            np.save('{}/time.npy'.format(self.path), vct_timestamp)
+
+        # раскладка по массивам ГНСС
+        for num_ext, ext in enumerate((self.__obsext__, self.__ephext__)):
+            dict_block = {}
+            for SV_name, SVdata in dict_SVdata[num_ext].items():
+                if not (SV_name[0] in dict_block):
+                    dict_block[SV_name[0]] = np.full((len(vct_timestamp), self.__svmax__[SV_name[0]],
+                                                      SVdata.shape[1]), np.nan)
+                dict_block[SV_name[0]][:, int(SV_name[1:]) - 1] = SVdata
+            for gnss, block in dict_block.items():
+                np.save('{}/{}{}'.format(self.path, gnss, ext), block)
+        self.__savemanifest__({'version': 2, 'SV': sorted(dict_SVdata[0]),
+                               'obs_types': manifest['obs_types'], 'SV_max': self.__svmax__,
+                               'SV_eph': sorted(dict_SVdata[1]), 'eph_types': manifest['eph_types'],
+                               'litertable': manifest['litertable']})
+        for file_old in list_old:
+            os.remove('{}/{}'.format(self.path, file_old))
 
     def __iter__(self):
         self.__pointer__ = 0
@@ -194,282 +838,1602 @@ class PyGNSS:
     def remove(self):
         shutil.rmtree(self.path)
 
-    def getobs(self, SV_name):
-        # потерял значение, задача метода изменена, необходимо переписать
-        file_SVobs = open('{}/{}{}'.format(self.path, SV_name, self.__obsext__))
-        flag_firstline = True
-        num_obs = 0
-        for line in file_SVobs:
-            if flag_firstline:
-                obs_types = line.split(';')
-                SV = dict.fromkeys(obs_types)
-                for key in SV:
-                    SV[key] = np.nan * np.arange(len(self.time))
-                flag_firstline = False
-            else:
-                dat = line.strip().split(';')
-                for k in range(len(dat)):
-                    SV[obs_types[k]][num_obs] = np.nan if dat[k] == '' else float(dat[k])
-                num_obs += 1
-        file_SVobs.close()
-        return (SV)
+    def refresh(self):
+        ''' Дочитывание растущего файла RINEX 3 (запись приёмника в реальном времени).
+        Разбор продолжается с последней метки времени, записанной в папку (место хранится в manifest.json),
+        новые эпохи дописываются в массивы папки, time, continious_time и словари созданных НКА
+        продлеваются на месте. Время работы зависит только от объёма новых данных.
+        Окно эпох, обрезанное с конца (cuttime), не продлевается. Укоротившийся или переписанный файл
+        (прочитанный конец не совпадает с отпечатком в manifest.json) преобразуется заново.
+        :return: число добавленных эпох'''
+        tail = self.__meta__.get('tail')
+        file_name = self.path[:-len(self.__pathext__)]
+        if tail is None:
+            print('Only plain RINEX files can be refreshed')  # сжатые и Hatanaka читаются только с начала
+            return 0
+        if not (os.path.exists(file_name)):
+            print('No RINEX file for refresh')
+            return 0
+        size_file = os.path.getsize(file_name)
+        # прочитанный конец файла сверяется с отпечатком (в папках без отпечатка - только по размеру)
+        rewritten = (size_file < tail['size']) or \
+            (tail.get('sha1') not in (None, self.__fingerprint__(file_name, tail)))
+        if (size_file == tail['size']) and not rewritten:
+            return 0
+        time_start = time.perf_counter()
+        size = len(self.__gridtime__)
+        if rewritten:
+            # файл переписан заново, преобразуется целиком, статистика продолжает накапливаться
+            stats, sink = self.stats, self.__statsink__
+            # словари НКА прежнего файла и таблица свойств НКА создаются заново при обращении
+            for name in self.SV_list_full + ['SVtable']:
+                self.__dict__.pop(name, None)
+            self.remove()
+            self.__init__(file_name, self.__meta__['time_interval'], self.eph_order, stats,
+                          aggregate=self.__meta__.get('aggregate'))
+            self.__statsink__ = sink
+            return len(self.__gridtime__)
+
+        ## Дозапись новых эпох в массивы папки
+        set_SV = set(self.__meta__['SV'])
+        resume = dict(tail, time_start=float(self.__gridtime__[0]), time_interval=self.__meta__['time_interval'],
+                      obs_types=self.__meta__['obs_types'], aggregate=self.__meta__.get('aggregate'))
+        for chunk in self.stream(file_name, resume=resume):
+            set_SV.update(chunk['SV'])
+            for gnss, block in chunk['obs'].items():
+                self.__arcsappend__(self.path, gnss, block, chunk['start'])
+            # вектор времени - последним: по нему определяется число эпох в папке
+            self.__npyappend__('{}/time.npy'.format(self.path), chunk['time'], chunk['start'])
+            self.__meta__['tail'] = chunk['tail']
+        self.__meta__['tail']['sha1'] = self.__fingerprint__(file_name, self.__meta__['tail'])
+        self.__meta__['SV'] = sorted(set_SV)
+        self.__savemanifest__(self.__meta__)
+
+        ## Продление открытых массивов
+        # строки измерений и таблицы дуг заново отображаются в память, прежние строки не копируются
+        self.__gridtime__ = np.load('{}/time.npy'.format(self.path), mmap_mode='c')
+        self.__obs__ = {}
+        start = int(np.searchsorted(self.__gridtime__, resume['time'] - 1e-6))  # первая перечитанная эпоха
+        if self.__timeind__.stop is None:
+            # эфемериды интерполируются только на новые эпохи и дописываются в буфер с запасом
+            for gnss, (start_block, buffer, filled) in list(self.__eph__.items()):
+                if start_block <= start <= start_block + filled:
+                    keep = start - start_block
+                    block = self.interpolate(self.__gridtime__[start:], gnss)
+                    buffer = self.__growbuffer__(buffer, keep + len(block), keep)
+                    buffer[keep:keep + len(block)] = block
+                    self.__eph__[gnss] = (start_block, buffer, keep + len(block))
+        self.SV_list_full[:] = self.__meta__['SV']
+        self.__dict__.pop('SVtable', None)  # таблица свойств НКА строится заново при обращении
+        if self.__timeind__.stop is None:
+            # в словари созданных НКА дописываются только новые эпохи
+            self.__settime__(self.__timeind__, start=start)
+        elif self.__timeind__.stop > start:
+            self.__settime__(self.__timeind__)
+        self.__stage__('refresh', time.perf_counter() - time_start, epochs=len(self.__gridtime__) - size,
+                       bytes_read=self.__meta__['tail']['size'] - tail['offset'])
+        return len(self.__gridtime__) - size
+
+    def getobs(self, timestamp, gnss=None):
+        ''' Измерения и эфемериды всех ячеек НКА на эпоху timestamp (datetime или float).
+        Измерения собираются из дуг видимости на одну эпоху, эфемериды - срезы общих массивов ГНСС.
+        Без gnss возвращается словарь {ГНСС: словарь измерений}'''
+        if isinstance(timestamp, datetime):
+            timestamp = timestamp.timestamp()
+        num_obs = int(np.searchsorted(self.continious_time, timestamp - 1e-6))
+        if (num_obs == len(self.continious_time)) or (abs(self.continious_time[num_obs] - timestamp) > 1e-6):
+            raise ValueError('No epoch {} in time array'.format(datetime.fromtimestamp(timestamp)))
+        if gnss is None:
+            return {gnss: self.getobs(timestamp, gnss) for gnss in sorted({SV[0] for SV in self.SV_list_full})}
+
+        block = self.__obsblock__(gnss, num_obs, num_obs + 1)[0]
+        obs = {obs_type: block[:, k] for k, obs_type in enumerate(self.__meta__['obs_types'][gnss])}
+        if any(SV_name[0] == gnss for SV_name in self.__meta__['SV_eph']):
+            block = self.__ephblock__(gnss)
+            for k, eph_type in enumerate(self.__meta__['eph_types']):
+                obs[eph_type] = block[num_obs, :, k]
+            obs['coordinates'] = block[num_obs, :, :3]
+        # свойства ячеек НКА
+        if not (gnss in self.__SVtable__):
+            list_info = [self.__SVinfo__('{}{:02d}'.format(gnss, num))
+                         for num in range(1, self.__meta__['SV_max'][gnss] + 1)]
+            self.__SVtable__[gnss] = {key: np.array([info[key] for info in list_info])
+                                      for key in ('name', 'num', 'prn')}
+        obs.update(self.__SVtable__[gnss])
+        return (obs)
+
+    def __exportmeta__(self, eph):
+        ''' Общее для выгрузки: виды измерений ГНСС из SV_list (объединение) и эфемерид (eph),
+        свойства НКА SV_list (строки SVtable), {ГНСС: ячейки НКА -> номер в SV_list, -1 - не выгружается}'''
+        dict_lookup = {}
+        for pos, SV_name in enumerate(self.SV_list):
+            gnss = SV_name[0]
+            if not (gnss in dict_lookup):
+                dict_lookup[gnss] = np.full(self.__meta__['SV_max'][gnss], -1)
+            dict_lookup[gnss][int(SV_name[1:]) - 1] = pos
+        types = []
+        for gnss in sorted(dict_lookup):
+            types.extend(obs_type for obs_type in self.__meta__['obs_types'][gnss] if not (obs_type in types))
+        if eph and any(SV_name[0] in dict_lookup for SV_name in self.__meta__['SV_eph']):
+            types.extend(self.__meta__['eph_types'])
+        rows = [self.SV_list_full.index(SV_name) for SV_name in self.SV_list]
+        info = {key: self.SVtable[key][rows] for key in ('name', 'gnss', 'num', 'prn', 'fullname')}
+        return types, info, dict_lookup
+
+    def __exportchunk__(self, start, stop, types, dict_lookup):
+        ''' Длинная таблица эпох start:stop окна: строка - НКА из SV_list на эпохе, где у него есть измерения,
+        по эпохам, внутри эпохи - по SV_list. Строки измерений собираются из дуг одной выборкой.
+        :return: номера эпох окна, номера НКА в SV_list, массив столбцов (types x строки)'''
+        window_start, window_stop, _ = self.__timeind__.indices(len(self.__gridtime__))
+        window = slice(window_start + start, min(window_start + stop, window_stop))
+        list_parts = []
+        for gnss, lookup in sorted(dict_lookup.items()):
+            epochs, cells, rows = self.__obsarcs__(gnss).index(window, np.flatnonzero(lookup >= 0))
+            list_parts.append((gnss, epochs, cells, rows))
+        epochs = np.concatenate([part[1] for part in list_parts] + [np.zeros(0, dtype=np.int64)])
+        SV = np.concatenate([dict_lookup[part[0]][part[2]] for part in list_parts] + [np.zeros(0, dtype=np.int64)])
+        order = np.lexsort((SV, epochs))
+        place = np.empty_like(order)
+        place[order] = np.arange(len(order))  # место строки каждой ГНСС в таблице
+        table = np.full((len(types), len(order)), np.nan)
+        num_row = 0
+        for gnss, epochs_gnss, cells, rows in list_parts:
+            dest = place[num_row:num_row + len(rows)]
+            num_row += len(rows)
+            ind = [types.index(obs_type) for obs_type in self.__meta__['obs_types'][gnss]]
+            table[np.array(ind)[:, None], dest] = self.__obsarcs__(gnss).rows[rows].T
+            if (self.__meta__['eph_types'] and (self.__meta__['eph_types'][0] in types) and
+                    any(SV_name[0] == gnss for SV_name in self.__meta__['SV_eph'])):
+                ind = [types.index(eph_type) for eph_type in self.__meta__['eph_types']]
+                sat = self.interpolate(self.continious_time[start:stop], gnss)
+                table[np.array(ind)[:, None], dest] = sat[epochs_gnss, cells].T
+        return epochs[order], SV[order], table
+
+    def to_dataframe(self, eph=True):
+        ''' Длинная таблица pandas.DataFrame окна эпох: строка - НКА из SV_list на эпохе, где у него есть измерения.
+        Столбцы: time (datetime64), sv, gnss, fullname (категории), num, prn - свойства НКА, виды измерений
+        и эфемерид (eph, интерполируются как в словарях НКА); столбцы измерений передаются без копирования'''
+        import pandas
+        types, info, dict_lookup = self.__exportmeta__(eph)
+        epochs, SV, table = self.__exportchunk__(0, len(self.continious_time), types, dict_lookup)
+        list_gnss, ind_gnss = np.unique(info['gnss'], return_inverse=True)
+        frame = {'time': self.time.datetime64()[epochs],
+                 'sv': pandas.Categorical.from_codes(SV, info['name']),
+                 'gnss': pandas.Categorical.from_codes(ind_gnss[SV], list_gnss),
+                 'num': info['num'][SV], 'prn': info['prn'][SV],
+                 'fullname': pandas.Categorical.from_codes(SV, info['fullname'])}
+        frame.update(zip(types, table))
+        return pandas.DataFrame(frame, copy=False)
+
+    def __arrowbatches__(self, eph, chunk_epochs):
+        ''' Длинная таблица окна эпох блоками по chunk_epochs эпох: генератор pyarrow.RecordBatch
+        (столбцы - как в to_dataframe, свойства НКА - словарные массивы по SV_list)'''
+        import pyarrow
+        types, info, dict_lookup = self.__exportmeta__(eph)
+        list_gnss, ind_gnss = np.unique(info['gnss'], return_inverse=True)
+        names = ['time', 'sv', 'gnss', 'num', 'prn', 'fullname'] + types
+        size = len(self.continious_time)
+        for start in range(0, max(size, 1), chunk_epochs):
+            epochs, SV, table = self.__exportchunk__(start, start + chunk_epochs, types, dict_lookup)
+            SV = SV.astype(np.int32)
+            arrays = [pyarrow.array(self.time[start:start + chunk_epochs].datetime64()[epochs]),
+                      pyarrow.DictionaryArray.from_arrays(SV, info['name']),
+                      pyarrow.DictionaryArray.from_arrays(ind_gnss[SV].astype(np.int32), list_gnss),
+                      pyarrow.array(info['num'][SV]), pyarrow.array(info['prn'][SV]),
+                      pyarrow.DictionaryArray.from_arrays(SV, info['fullname'])]
+            yield pyarrow.RecordBatch.from_arrays(arrays + [pyarrow.array(column) for column in table], names)
+
+    def to_arrow(self, eph=True, chunk_epochs=2880):
+        ''' Длинная таблица pyarrow.Table окна эпох (столбцы - как в to_dataframe), собирается из блоков
+        по chunk_epochs эпох; столбцы измерений передаются без копирования'''
+        import pyarrow
+        return pyarrow.Table.from_batches(list(self.__arrowbatches__(eph, chunk_epochs)))
+
+    def to_parquet(self, file_name, eph=True, chunk_epochs=2880, **options):
+        ''' Запись длинной таблицы окна эпох (столбцы - как в to_dataframe) в файл Parquet блоками
+        по chunk_epochs эпох (группа строк на блок), память не зависит от длины сеанса.
+        options - параметры pyarrow.parquet.ParquetWriter (compression...)
+        :return: число записанных строк'''
+        import pyarrow.parquet
+        writer = None
+        num_rows = 0
+        for batch in self.__arrowbatches__(eph, chunk_epochs):
+            if writer is None:
+                writer = pyarrow.parquet.ParquetWriter(file_name, batch.schema, **options)
+            writer.write_batch(batch)
+            num_rows += batch.num_rows
+        writer.close()
+        return num_rows
+
+    def to_xarray(self, eph=True, chunk_epochs=2880):
+        ''' Набор данных xarray.Dataset окна эпох для НКА из SV_list: переменные - виды измерений и эфемерид
+        (eph) по осям time x sv, координаты НКА - sv, gnss, num, prn, fullname; dataset.to_array('observable') -
+        массив time x sv x observable. Переменные - срезы одного массива (виды x эпохи x НКА) без копирования,
+        он заполняется из дуг блоками по chunk_epochs эпох'''
+        import xarray
+        types, info, dict_lookup = self.__exportmeta__(eph)
+        size = len(self.continious_time)
+        window_start, window_stop, _ = self.__timeind__.indices(len(self.__gridtime__))
+        data = np.full((len(types), size, len(self.SV_list)), np.nan)
+        for gnss, lookup in dict_lookup.items():
+            ind = np.array([types.index(obs_type) for obs_type in self.__meta__['obs_types'][gnss]])[:, None]
+            has_eph = (self.__meta__['eph_types'] and (self.__meta__['eph_types'][0] in types) and
+                       any(SV_name[0] == gnss for SV_name in self.__meta__['SV_eph']))
+            for start in range(0, size, chunk_epochs):
+                window = slice(window_start + start, min(window_start + start + chunk_epochs, window_stop))
+                epochs, cells, rows = self.__obsarcs__(gnss).index(window, np.flatnonzero(lookup >= 0))
+                data[ind, start + epochs, lookup[cells]] = self.__obsarcs__(gnss).rows[rows].T
+                if has_eph:
+                    sat = self.interpolate(self.continious_time[start:start + chunk_epochs], gnss)
+                    for k, eph_type in enumerate(self.__meta__['eph_types']):
+                        data[types.index(eph_type), start:start + len(sat)][:, lookup[lookup >= 0]] = \
+                            sat[:, lookup >= 0, k]
+        coords = {'time': self.time.datetime64(), 'sv': info['name'], 'gnss': ('sv', info['gnss']),
+                  'num': ('sv', info['num']), 'prn': ('sv', info['prn']), 'fullname': ('sv', info['fullname'])}
+        return xarray.Dataset({obs_type: (('time', 'sv'), data[k]) for k, obs_type in enumerate(types)}, coords)
 
     def filt(self, **options):
-        ''' Фильтрация по параметрам. Изменяет список НКА для выдачи итератором'''
-        regexp = ''
-        self.SV_list = self.SV_list_full.copy()
+        ''' Фильтрация по параметрам. Изменяет список НКА для выдачи итератором;
+        time=(start, end) - окно эпох всей сетки (как cuttime, без копирования), без time окно не меняется'''
+        # условия gnss, prn, num проверяются по таблице свойств НКА одним проходом
+        query = SVQuery(gnss=options.get('gnss', 'GREC'),
+                        **{key: options[key] for key in ('prn', 'num') if options.get(key, None)})
+        self.SV_list = self.SVtable['name'][query(self.SVtable)].tolist()
+
+        # фильтрация по времени
+        timerange = options.get('time', None)
+        if timerange:
+            self.__settime__(self.__timewindow__(timerange[0], timerange[1], slice(0, None))[0])
+
+    def query(self, *queries, **options):
+        ''' Отбор НКА по условиям SVQuery (объединяются по И) и параметрам SVQuery(**options).
+        Исходный объект не меняется.
+        :return: PyGNSS-представление с отобранными НКА в SV_list (массивы общие, без копирования)'''
+        mask = SVQuery(**options)(self.SVtable)
+        for query in queries:
+            mask &= query(self.SVtable)
+        return self.__view__(self.SVtable['name'][mask].tolist())
 
-        # собираем регулярное выражение для фильтрации имен файлов(НКА) в списке
-        regexp = '[{}]'.format(options.get('gnss', 'GREC'))
-        for SV in self.SV_list_full:
-            if not (re.search(regexp, SV)):
-                self.SV_list.remove(SV)  # удаляем элементы, которые не проходят фильтрацию
-
-        # фильтрация по PRN
-        prnlist = options.get('prn', None)
-        if prnlist:
-            for SV in self.SV_list_full:
-                if not (getattr(self, SV)['prn'] in prnlist) and (getattr(self, SV)['name'] in self.SV_list):
-                    self.SV_list.remove(SV)  # удаляем элементы, которые не проходят фильтрацию
-
-        # фильтрация по NUM
-        numlist = options.get('num', None)
-        if numlist:
-            for SV in self.SV_list_full:
-                if not (getattr(self, SV)['num'] in numlist) and (getattr(self, SV)['name'] in self.SV_list):
-                    self.SV_list.remove(SV)  # удаляем элементы, которые не проходят фильтрацию
+    def __view__(self, SV_list):
+        ''' Представление объекта: общие массивы ГНСС и таблицы, свои список НКА, окно эпох и словари НКА'''
+        view = object.__new__(type(self))
+        view.__dict__.update((key, value) for key, value in self.__dict__.items()
+                             if not (key in self.SV_list_full))
+        view.__meta__ = copy.deepcopy(self.__meta__)  # refresh представления не сдвигает место чтения объекта
+        view.__obs__ = dict(self.__obs__)
+        view.__eph__ = dict(self.__eph__)
+        view.__SVbuf__ = {}  # словари НКА у представления свои
+        view.__derived__ = dict(self.__derived__)
+        view.SV_list_full = list(self.SV_list_full)
+        view.SV_list = SV_list
+        return view
 
     def reset(self):
-        ''' Сброс параметров фильтра и возвращение исходного списка НКА'''
+        ''' Сброс параметров фильтра и возвращение исходного списка НКА и всей сетки времени'''
         self.SV_list = self.SV_list_full.copy()
+        if self.__timeind__ != slice(0, None):
+            self.__settime__(slice(0, None))
 
     def cuttime(self, start_time, end_time):
         """"
-        :param start_time: datetime type
-        :param end_time: datetime type
+        Обрезка по времени внутри текущего окна эпох: массивы НКА становятся срезами, без копирования
+        :param start_time: datetime type (float, None - без ограничения)
+        :param end_time: datetime type (float, None - без ограничения)
         :return: PyGNSS обрезанный по времени
         """
-        self.reset()
-        ind_not_removing = (self.continious_time >= start_time.timestamp()) & (
-        self.continious_time <= end_time.timestamp())
-        for SV in self:
-            for key in SV.keys():
-                if not (type(SV[key]) == np.ndarray):
-                    # защита от невекторных свойств
-                    continue
-                SV[key] = SV[key][ind_not_removing]
-        self.continious_time = self.continious_time[ind_not_removing]
-        self.time = [datetime.fromtimestamp(temp) for temp in self.continious_time]
-
-    def __parseRINEX__(self, rinex_file_name, time_interval):
-        file_rinexobs = open(rinex_file_name)
-        os.mkdir(self.path)
-        ## Чтение шапки и временных меток
-        ObsTypes = [[] for k in range(3)]
-        list_time = []
-        for line in file_rinexobs:
+        time_start = time.perf_counter()
+        self.SV_list = self.SV_list_full.copy()
+        self.__settime__(*self.__timewindow__(start_time, end_time, self.__timeind__))
+        self.__stage__('cuttime', time.perf_counter() - time_start, epochs=len(self.continious_time))
+        return self
+
+    @classmethod
+    def __splitext__(cls, file_name):
+        ''' Имя файла без расширения сжатия и само расширение ('' - файл не сжат)'''
+        for ext in cls.__compext__:
+            if file_name.endswith(ext):
+                return file_name[:-len(ext)], ext
+        return file_name, ''
+
+    @classmethod
+    def __findfile__(cls, file_name):
+        ''' Существующий файл file_name, несжатый или сжатый (file_name.gz...), None - нет такого'''
+        for ext in ('',) + cls.__compext__:
+            if os.path.exists(file_name + ext):
+                return file_name + ext
+        return None
+
+    @classmethod
+    def __isobs__(cls, file_name):
+        ''' Файл измерений: короткое имя .o/.O, Hatanaka .yyd/.yyD, длинное имя ..._MO.rnx/.crx; сжатый или нет'''
+        name = cls.__splitext__(file_name)[0]
+        return ((name[-1:] in ('o', 'O')) or name.endswith(('O.rnx', 'O.crx')) or
+                ((name[-1:] in ('d', 'D')) and (name[-4:-3] == '.') and name[-3:-1].isdigit()))
+
+    @staticmethod
+    def __fingerprint__(file_name, tail):
+        ''' Отпечаток прочитанного конца несжатого файла измерений: sha1 байт от последней прочитанной метки
+        времени (tail['offset']) до конца прочитанного (tail['size'])'''
+        with open(file_name, 'rb') as file_rinexobs:
+            file_rinexobs.seek(tail['offset'])
+            return hashlib.sha1(file_rinexobs.read(tail['size'] - tail['offset'])).hexdigest()
+
+    @classmethod
+    def __navfiles__(cls, file_name):
+        ''' Навигационные файлы рядом с файлом измерений: .g - ГЛОНАСС, .n - GPS, .l - Galileo,
+        .p - смешанный; для длинных имён - ..._MN.rnx, _GN, _RN, _EN того же сеанса'''
+        name = cls.__splitext__(file_name)[0]
+        if name[-4:] in ('.rnx', '.crx'):
+            prefix = name[:-7].rsplit('_', 1)[0]  # без шага измерений и типа файла
+            list_names = ['{}_{}N.rnx'.format(prefix, gnss) for gnss in 'MGRE']
+        else:
+            list_names = [name[:-1] + ext for ext in 'gnlpGNLP']
+        return [file_nav for file_nav in map(cls.__findfile__, list_names) if file_nav is not None]
+
+    @classmethod
+    def __seekable__(cls, file_name):
+        ''' Положение в файле можно запомнить для refresh: несжатый RINEX (не Hatanaka)'''
+        if cls.__splitext__(file_name)[1]:
+            return False
+        with open(file_name, encoding='latin-1', newline='') as file_text:
+            return not ('CRINEX VERS' in file_text.readline())
+
+    @classmethod
+    def __readlines__(cls, file_name, offset=0):
+        ''' Строки текстового файла данных с положения offset (только для несжатых).
+        latin-1 и newline='' - один символ на байт. Сжатые файлы распаковываются по ходу чтения:
+        .gz - gzip, .bz2 - bz2, .Z (compress) - через канал gzip -dc; Hatanaka (CRINEX 3) раскрывается
+        в строки RINEX 3 (__crx2rnx__). Временные файлы не создаются. Генератор, close() закрывает файл.
+        Повреждённый или обрезанный сжатый файл - исключение (для .Z - OSError с сообщением gzip)'''
+        ext = cls.__splitext__(file_name)[1]
+        process = None
+        if ext == '.gz':
+            file_text = gzip.open(file_name, 'rt', encoding='latin-1', newline='')
+        elif ext == '.bz2':
+            file_text = bz2.open(file_name, 'rt', encoding='latin-1', newline='')
+        elif ext == '.Z':
+            # в стандартной библиотеке нет LZW, распаковывает gzip
+            try:
+                process = subprocess.Popen(['gzip', '-dc', file_name], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            except FileNotFoundError as error:
+                raise OSError('No gzip program to decompress {}'.format(file_name)) from error
+            file_text = io.TextIOWrapper(process.stdout, encoding='latin-1', newline='')
+        else:
+            file_text = open(file_name, encoding='latin-1', newline='')
+            file_text.seek(offset)
+        try:
+            line = next(file_text, '')
+            if 'CRINEX VERS' in line:
+                yield from cls.__crx2rnx__(file_text)
+            elif line:
+                yield line
+                yield from file_text
+        finally:
+            file_text.close()
+            if process is not None:
+                # при досрочном закрытии gzip завершается по закрытому каналу, ошибкой это не считается
+                message = process.stderr.read().decode(errors='replace').strip()
+                process.stderr.close()
+                process.wait()
+        if (process is not None) and process.returncode:
+            raise OSError('Decompression of {} failed: {}'.format(file_name, message or process.returncode))
+
+    @staticmethod
+    def __crx2rnx__(file_crx):
+        ''' Раскрытие Hatanaka (CRINEX 3, после строки CRINEX VERS) в строки RINEX 3 по ходу чтения.
+        Строка эпохи и флаги LLI/SSI НКА - разность текста с предыдущей ('&' - пробел, ' ' - без изменений),
+        строка эпохи, записанная полностью ('>'), начинает все НКА заново,
+        измерения - целые тысячные: n&значение начинает дугу с разностями порядка n, далее - разности,
+        пустое поле - нет измерения. Эпоха с событием (флаг > 1) и следующая за ней записаны полностью.
+        Незаконченная последняя строка (файл ещё пишется) не выдаётся'''
+        def repair(text, diff):
+            if len(diff) > len(text):
+                text = text.ljust(len(diff))
+            return ''.join(char if code == ' ' else (' ' if code == '&' else code)
+                           for char, code in zip(text, diff)) + text[len(diff):]
+
+        num_types = {}
+        for line in file_crx:  # шапка RINEX без строки CRINEX PROG
+            if 'CRINEX PROG' in line[60:]:
+                continue
+            yield line
+            if 'SYS / # / OBS TYPES' in line[60:] and line[0] != ' ':
+                num_types[line[0]] = int(line[3:6])
+            elif 'END OF HEADER' in line[60:]:
+                break
+
+        def undiff(arc, field):
+            # дуга - [порядок, значение, разности...]: разность старшего порядка досчитывается до значения
+            if field[1:2] == '&':
+                return [int(field[0]), int(field[2:])]
+            if len(arc) <= arc[0] + 1:
+                arc.append(int(field))
+            else:
+                arc[-1] = int(field)
+            for ind in range(len(arc) - 2, 0, -1):
+                arc[ind] += arc[ind + 1]
+            return arc
+
+        ## Дуги измерений: ячейки НКА x виды измерений, разности считаются для всей эпохи сразу
+        size_max = max(num_types.values(), default=0)
+        dict_rows = {}  # НКА: первая ячейка
+        diffs = np.zeros((10, 0), dtype=np.int64)  # члены дуг: значение и разности до 9-го порядка x ячейки
+        size_terms = 1  # число членов самой длинной дуги
+        counts = np.zeros(0, dtype=int)  # число хранимых членов (значение и разности), 0 - нет дуги
+        orders = np.zeros(0, dtype=int)
+        dict_flags = {}  # флаги LLI/SSI НКА прошлой эпохи
+        dict_format = {}  # строки формата измерений НКА: (НКА, флаги, пропуски) - строка формата
+        epoch = ''
+        clock = None  # дуга смещения часов приёмника
+        list_SVprev, cells = None, None
+        for line in file_crx:
+            if line[-1] != '\n':
+                return
+            line = line.rstrip('\r\n')
+            if line[:1] == '>':
+                # эпоха записана полностью: все НКА начинаются заново
+                epoch = line
+                dict_flags = {}
+            else:
+                epoch = repair(epoch, line)
+            if epoch[31:32] > '1':
+                # событие: строка эпохи и записи без сжатия, следующая эпоха - полностью
+                yield epoch.rstrip() + '\n'
+                for _ in range(int(epoch[32:35])):
+                    line = next(file_crx, '')
+                    if line[-1:] != '\n':
+                        return
+                    yield line
+                epoch = ''
+                continue
+            line = next(file_crx, '')
+            if line[-1:] != '\n':
+                return
+            field = line.strip()
+            clock = undiff(clock, field) if field else None
+            line_epoch = epoch[:35] + ('' if clock is None else '{:21.12f}'.format(clock[1] / 1e12)) + '\n'
+
+            # поля измерений всех НКА эпохи: пропуски - 0, начала дуг - значения
+            list_SV = [epoch[k:k + 3] for k in range(41, 41 + 3 * int(epoch[32:35]), 3)]
+            list_fields, list_rows, list_sizes, list_format, list_init = [], [], [], [], []
+            dict_prev, dict_flags = dict_flags, {}
+            for SV in list_SV:
+                line = next(file_crx, '')
+                if line[-1:] != '\n':
+                    return
+                size = num_types.get(SV[0], 0)
+                fields = line.rstrip('\r\n').split(' ', size)
+                row = dict_rows.get(SV)
+                if row is None:
+                    row = dict_rows[SV] = len(dict_rows) * size_max
+                    if row + size_max > len(counts):
+                        diffs = np.concatenate((diffs, np.zeros((len(diffs), 64 * size_max), dtype=np.int64)), axis=1)
+                        counts = np.concatenate((counts, np.zeros(64 * size_max, dtype=int)))
+                        orders = np.concatenate((orders, np.zeros(64 * size_max, dtype=int)))
+                flags = dict_prev.get(SV)
+                if flags is None:
+                    # НКА, которого не было в прошлой эпохе, начинается заново
+                    flags = ''
+                    counts[row:row + size_max] = 0
+                if len(fields) > size:
+                    flags = repair(flags, fields.pop())
+                elif len(fields) < size:
+                    fields.extend([''] * (size - len(fields)))
+                dict_flags[SV] = flags
+                blanks = ()
+                if ('&' in line) or ('' in fields):
+                    blanks = tuple(num for num in range(size) if not fields[num])
+                    for num in blanks:
+                        fields[num] = '0'
+                    for num, field in enumerate(fields):
+                        if field[1:2] == '&':
+                            list_init.append((len(list_fields) + num, int(field[0])))
+                            fields[num] = field[2:]
+                    list_init.extend((len(list_fields) + num, -1) for num in blanks)
+                list_fields.extend(fields)
+                list_rows.append(row)
+                list_sizes.append(size)
+                fmt = dict_format.get((SV, flags, blanks))
+                if fmt is None:
+                    if len(dict_format) > 4096:
+                        dict_format.clear()
+                    fmt = dict_format[SV, flags, blanks] = (SV + ''.join(
+                        (' ' * 14 if num in blanks else '%14.3f') + flags[2 * num:2 * num + 2].ljust(2).replace('%', '%%')
+                        for num in range(size))).rstrip() + '\n'
+                list_format.append(fmt)
+            values = np.fromstring(' '.join(list_fields), dtype=np.int64, sep=' ')
+            if list_SV != list_SVprev:
+                # ячейки эпохи не меняются, пока не меняется список НКА
+                cells = np.repeat(np.array(list_rows, dtype=int) - np.cumsum([0] + list_sizes[:-1]), list_sizes)
+                cells += np.arange(len(cells))
+                list_SVprev = list_SV
+            ind, diff = cells, values
+            if list_init:
+                # начала дуг (порядок) и пропуски (порядок -1 - дуги нет), члены дуги выше значения - 0
+                ind_init, order = np.array(list_init, dtype=int).T
+                diffs[:, cells[ind_init]] = 0
+                diffs[0, cells[ind_init]] = values[ind_init]
+                size_terms = max(size_terms, order.max() + 1)
+                counts[cells[ind_init]] = order >= 0
+                orders[cells[ind_init]] = order
+                is_diff = np.ones(len(cells), dtype=bool)
+                is_diff[ind_init] = False
+                ind, diff = cells[is_diff], values[is_diff]
+            # разность старшего порядка дописывается (или заменяет последнюю), младшие члены досчитываются:
+            # прежний член + новый следующий (члены выше разности - нули)
+            pos = np.minimum(counts[ind], orders[ind])
+            terms = diffs[:size_terms, ind]
+            terms[pos, np.arange(len(ind))] = diff
+            for num in range(size_terms - 2, -1, -1):
+                terms[num] += terms[num + 1]
+            diffs[:size_terms, ind] = terms
+            counts[ind] = pos + 1
+            values = diffs[0, cells] / 1000
+            if list_init:
+                values = values[is_diff | (counts[cells] > 0)]  # без пропусков
+
+            # строки RINEX эпохи - одной строкой формата
+            yield line_epoch
+            yield from (''.join(list_format) % tuple(values.tolist())).splitlines(True)
+
+    @staticmethod
+    def __aggregate__(rows, aggregate):
+        ''' Свёртка измерений эпох интервала rows (эпохи x НКА x виды) по первой оси без учёта nan:
+        mean - среднее, median - медиана; нет измерений - nan'''
+        count = (~np.isnan(rows)).sum(axis=0)
+        if aggregate == 'mean':
+            with np.errstate(invalid='ignore'):
+                return np.nansum(rows, axis=0) / np.where(count, count, np.nan)
+        # nan сортируются в конец, медиана - по count первым значениям
+        rows = np.sort(rows, axis=0)
+        low = np.take_along_axis(rows, np.maximum(count - 1, 0)[None] // 2, axis=0)[0]
+        high = np.take_along_axis(rows, count[None] // 2, axis=0)[0]
+        return np.where(count, (low + high) / 2, np.nan)
+
+    @classmethod
+    def stream(cls, file_name, chunk_epochs=2880, time_interval=30, resume=None, decimate=1, aggregate=None):
+        ''' Чтение RINEX 3 блоками по chunk_epochs эпох сетки времени, память не зависит от длины файла.
+        Файлы Hatanaka (CRINEX 3) и сжатые (.gz, .Z, .bz2) раскрываются по ходу чтения (__readlines__).
+        Метки времени читаются с долями секунды, номера эпох сетки считаются в целых наносекундах.
+        time_interval - наименьший шаг сетки, с (шаг сетки - не меньше шага эпох файла);
+        decimate - в сетку входит каждая decimate-я эпоха такой сетки.
+        aggregate - 'mean' или 'median': кодовые измерения (C..) всех эпох файла в интервале +-шаг/2 вокруг эпохи
+        сетки сворачиваются в среднее или медиану, прочие измерения берутся на самой эпохе сетки (нет её - nan);
+        в свёртку каждого НКА и вида входят его измерения не дальше от эпохи сетки, чем крайние его измерения
+        интервала с обеих её сторон (интервал симметричен эпохе сетки, в т.ч. на краю шага, у начала файла
+        и на краях дуг), поэтому среднее относится к самой эпохе сетки; в памяти - только эпохи одного интервала. Без aggregate эпохи вне сетки пропускаются.
+        resume - продолжение чтения с места предыдущего (словарь tail из блока, дополненный
+        time_start, time_interval, obs_types, aggregate), шапка при этом не читается.
+        Незаконченная последняя строка файла (файл ещё пишется) не читается.
+        Генератор словарей:
+            start - номер первой эпохи блока на сетке
+            time - метки времени блока, float
+            obs - {ГНСС: массив измерений (эпохи x НКА x виды измерений)}, индекс НКА = номер - 1
+            obs_types - {ГНСС: виды измерений}
+            SV - множество НКА, встретившихся в блоке
+            time_interval - шаг сетки времени
+            tail - место продолжения чтения: offset - положение в файле последней прочитанной метки
+                времени (при aggregate - первой метки последнего интервала), time - её значение,
+                size - число прочитанных байт
+            stats - счётчики с начала чтения: epochs - прочитано меток времени, skipped - из них вне сетки,
+                strptime - вызовов strptime, time_header - время чтения шапки, с'''
+        if not (aggregate in (None, 'mean', 'median')):
+            raise ValueError('Unknown aggregate mode {}'.format(aggregate))
+        # один символ на байт, положение в файле считается по длинам строк (в сжатых - по распакованным)
+        file_rinexobs = cls.__readlines__(file_name, 0 if resume is None else resume['offset'])
+        offset = 0
+        time_header = time.perf_counter()
+        ## Чтение шапки
+        ObsTypes = {}
+        gnss = None
+        for line in (file_rinexobs if resume is None else ()):
+            offset += len(line)
             if 'RINEX VERSION' in line:  # проверка формата
                 if line[5] != '3':
                     print('Incompatible RINEX version')
-                    break
+                    file_rinexobs.close()
+                    return
             elif 'OBS TYPES' in line:  # виды измерений
-                ObsTypes_temp = line[7:60].split()
-                if line[0] == 'G':
-                    gnss = 1
-                elif line[0] == 'R':
-                    gnss = 2
-                elif line[0] == 'E':
-                    gnss = 3
-                elif line[0] == ' ':
-                    pass
-                else:
-                    gnss = None
-
-                if gnss == None:
+                if line[0] != ' ':  # строка продолжения относится к предыдущей ГНСС
+                    gnss = line[0] if line[0] in cls.__svmax__ else None
+                if gnss is None:
                     print('Unknown GNSS type')
                     continue
-                else:
-                    ObsTypes[gnss - 1].extend(ObsTypes_temp)
-            elif '>' in line:  # метки времени
-                list_time.append(datetime.strptime(line[2:21], '%Y %m %d %H %M %S'))
-        file_rinexobs.close()
+                ObsTypes.setdefault(gnss, []).extend(line[7:60].split())
+            elif 'END OF HEADER' in line:
+                break
 
-        ## Подготовка вектора времени
-        time_interval = np.maximum((list_time[2].timestamp() - list_time[1].timestamp()), time_interval)
-        vct_timestamp = np.arange(time_interval * np.ceil(list_time[0].timestamp() / time_interval),
-                                  list_time[-1].timestamp() + 0.001,
-                                  time_interval)  # поправка 0,001 чтобы последний элемент тоже был включён
-        list_time = []
-        for timestmp in vct_timestamp:
-            list_time.append(datetime.fromtimestamp(timestmp))
-        # Запись в файл     
-        file_time = open('{}/time.csv'.format(self.path), 'w')
-        for timestamp in list_time:
-            file_time.write(str(datetime.timestamp(timestamp)) + '\n')
-        file_time.close()
-
-        ## Создание файла инициализации        
-        pass
-        ## Чтение измерений и запись в отдельные файлы
-        file_rinexobs = open(rinex_file_name)
-        num_obs = 0
-        dict_SepObsFiles = {}
-        list_ObsFilesForRemoving = []
-        flag_Header = False
-        for line in file_rinexobs:
+        # метки времени - целые наносекунды: strptime вызывается один раз на каждый час,
+        # минуты и секунды с долями (F11.7) досчитываются
+        dict_hourstamp = {}
+
+        def epochstamp(line):
+            key = line[2:15]
+            stamp = dict_hourstamp.get(key)
+            if stamp is None:
+                stamp = dict_hourstamp[key] = int(datetime.strptime(key, '%Y %m %d %H').timestamp()) * 10 ** 9
+            return stamp + int(line[16:18]) * 60 * 10 ** 9 + int(round(float(line[18:29]) * 1e9))
+
+        time_header = time.perf_counter() - time_header
+
+        ## Подготовка сетки времени
+        list_buffer = []
+        if resume is not None:
+            # сетка известна, чтение - с последней прочитанной метки времени
+            ObsTypes = resume['obs_types']
+            step = int(round(resume['time_interval'] * 1e9))
+            time_start = int(round(resume['time_start'] * 1e6)) * 1000  # в папке - с точностью до мкс
+            aggregate = resume.get('aggregate')
+            offset = resume['offset']
+            list_time = [int(round(resume['time'] * 1e6)) * 1000]
+        else:
+            # шаг определяется по 2-й и 3-й эпохам, поэтому начало файла буферизуется
+            list_time = []
+            for line in file_rinexobs:
+                list_buffer.append(line)
+                if line[0] == '>':
+                    list_time.append(epochstamp(line))
+                    if len(list_time) == 3:
+                        break
+            if not list_time:
+                print('No epochs in RINEX file')
+                file_rinexobs.close()
+                return
+            step = int(round(time_interval * 1e9))
+            if len(list_time) == 3:
+                step = max(list_time[2] - list_time[1], step)
+            step *= decimate
+            time_start = -(-list_time[0] // step) * step
+        time_interval = step / 1e9
+
+        def gridindex(stamp):
+            # номер ближайшей эпохи сетки
+            return (stamp - time_start + step // 2) // step
+
+        nan = float('nan')
+
+        def newchunk(start):
+            return {'start': start,
+                    'time': np.round((time_start + step * np.arange(start, start + chunk_epochs)) / 1e9, 6),
+                    'obs': {gnss: np.full((chunk_epochs, cls.__svmax__[gnss], len(obs_types)), nan)
+                            for gnss, obs_types in ObsTypes.items()},
+                    'obs_types': ObsTypes, 'SV': set(), 'time_interval': time_interval}
+
+        def cutchunk(chunk, size):
+            chunk['time'] = chunk['time'][:size]
+            for gnss in chunk['obs']:
+                chunk['obs'][gnss] = chunk['obs'][gnss][:size]
+            return chunk
+
+        ## Чтение измерений блоками
+        # при продолжении первая эпоха блока - первая эпоха сетки не раньше последней прочитанной метки,
+        # при aggregate - эпоха интервала, с первой метки которого продолжается чтение
+        if resume is None:
+            chunk = newchunk(0)
+        elif aggregate is None:
+            chunk = newchunk(max(-((time_start + 1000 - list_time[0]) // step), 0))
+        else:
+            chunk = newchunk(max(gridindex(list_time[0]), 0))
+        dict_block = chunk['obs']  # куда пишутся строки НКА: блок или буфер интервала
+        num_obs = -1  # номер эпохи в блоке (при aggregate - в буфере интервала), -1 - эпоха вне сетки
+        num_epochs = num_skipped = 0
+        time_last = list_time[-1]
+        # свёртка: эпохи текущего интервала сетки num_bin копятся в буфере (num_rows эпох,
+        # node - номер эпохи на самой эпохе сетки, list_offset - смещения эпох буфера от эпохи сетки, нс)
+        dict_buffer = {gnss: np.full((2, cls.__svmax__[gnss], len(obs_types)), nan)
+                       for gnss, obs_types in ObsTypes.items()}
+        dict_code = {gnss: [k for k, obs_type in enumerate(obs_types) if obs_type[0] == 'C']
+                     for gnss, obs_types in ObsTypes.items()}
+        num_bin = None
+        num_rows = 0
+        node = -1
+        list_offset = []
+
+        def flush():
+            # интервал num_bin - в строку блока; измерения за пределами симметричной части интервала
+            # (по каждому НКА и виду) отбрасываются, измерения только с одной стороны берутся все
+            vct_offset = np.array(list_offset, dtype=float)[:, None, None]
+            for gnss, buffer in dict_buffer.items():
+                rows = buffer[:num_rows]
+                row = chunk['obs'][gnss][num_bin - chunk['start']]
+                if node >= 0:
+                    row[:] = rows[node]
+                code = dict_code[gnss]
+                rows_code = rows[:, :, code]
+                valid = ~np.isnan(rows_code)
+                limit = np.minimum(np.where(valid, vct_offset, -np.inf).max(axis=0),
+                                   np.where(valid, -vct_offset, -np.inf).max(axis=0))
+                rows_code[valid & (limit >= 0) & (np.abs(vct_offset) > limit + 1000)] = nan
+                row[:, code] = cls.__aggregate__(rows_code, aggregate)
+                rows[:] = nan
+
+        def chunkstats():
+            return {'epochs': num_epochs, 'skipped': num_skipped, 'strptime': len(dict_hourstamp),
+                    'time_header': time_header}
+        tail = {'offset': offset, 'time': time_last / 1e9, 'size': offset}
+        for line in itertools.chain(list_buffer, file_rinexobs):
+            if line[-1] != '\n':
+                if not (cls.__seekable__(file_name)):
+                    # сжатый или Hatanaka файл не дописывается: обрезан (.Z сам обрыв не обнаруживает)
+                    file_rinexobs.close()
+                    raise EOFError('Incomplete last line in {}'.format(file_name))
+                break  # незаконченная строка в конце пишущегося файла
+            offset += len(line)
             # метка времени
-            if (line[0] == '>'):
-                # если нет такого элемента в векторе времени
-                if not (datetime.strptime(line[2:21], '%Y %m %d %H %M %S') in list_time):
-                    flag_Header = False
+            if line[0] == '>':
+                time_last = epochstamp(line)
+                num_epochs += 1
+                num_obs = gridindex(time_last)
+                if aggregate is None:
+                    tail = {'offset': offset - len(line), 'time': time_last / 1e9}
+                    # если нет такого элемента в векторе времени (или блок с ним уже выдан)
+                    if (num_obs < chunk['start']) or (abs(time_start + num_obs * step - time_last) > 1000):
+                        num_obs = -1
+                        num_skipped += 1
+                        continue
+                elif num_obs != num_bin:
+                    # новый интервал: накопленный сворачивается, продолжение чтения - с этой метки
+                    if num_rows:
+                        flush()
+                    tail = {'offset': offset - len(line), 'time': time_last / 1e9}
+                    num_bin, num_rows, node = num_obs, 0, -1
+                    list_offset.clear()
+                if num_obs < chunk['start']:
+                    num_obs = -1
+                    num_skipped += 1
+                    continue
+                while num_obs >= chunk['start'] + chunk_epochs:
+                    chunk['tail'] = dict(tail, size=offset)
+                    chunk['stats'] = chunkstats()
+                    yield chunk
+                    chunk = newchunk(chunk['start'] + chunk_epochs)
+                if aggregate is None:
+                    dict_block = chunk['obs']
+                    num_obs -= chunk['start']
                     continue
-                kol_missed_obs = list_time.index(datetime.strptime(line[2:21],
-                                                                   '%Y %m %d %H %M %S')) - num_obs - 1  # для отработки пропущенных моментов времени
-                # поиск соответствующего номера наблюдения
-                num_obs = list_time.index(datetime.strptime(line[2:21], '%Y %m %d %H %M %S'))
-                # Заполнение пустыми строками файлов, в которые не писали на прошлом такте
-                for SepObsFile in list_ObsFilesForRemoving:
-                    SepObsFile.write('\n')
-                # Заполнение пустыми строками пропусков в измерениях
-                for SepObsFile in dict_SepObsFiles.values():
-                    for k in range(kol_missed_obs):
-                        SepObsFile.write('\n')
-                # новая инициализация списка имён файлов для механизма записи пустых строк
-                list_ObsFilesForRemoving = list(dict_SepObsFiles.values())
-                flag_Header = True
+                # эпоха - в буфер интервала, буфер растёт по мере надобности
+                list_offset.append(time_last - time_start - num_obs * step)
+                if abs(list_offset[-1]) <= 1000:
+                    node = num_rows
+                if dict_buffer and (num_rows == len(next(iter(dict_buffer.values())))):
+                    for gnss, buffer in dict_buffer.items():
+                        dict_buffer[gnss] = np.concatenate((buffer, np.full_like(buffer, nan)))
+                dict_block = dict_buffer
+                num_obs = num_rows
+                num_rows += 1
                 continue
-                # измерения GPS
-            elif (line[0] == 'G') and (flag_Header):
-                line = line.replace('G ', 'G0')  # защита от файлов с пробелом вместо нуля
-                gnss = 0
-            # измерения GLO
-            elif (line[0] == 'R') and (flag_Header):
-                line = line.replace('R ', 'R0')  # защита от файлов с пробелом вместо нуля
-                gnss = 1
-            # измерения GAL
-            elif (line[0] == 'E') and (flag_Header):
-                line = line.replace('E ', 'E0')  # защита от файлов с пробелом вместо нуля
-                gnss = 2
-            # остальные строки
-            else:
+            if (num_obs < 0) or not (line[0] in ObsTypes):  # остальные строки
                 continue
-
-                # запись наблюдений в отдельный файл
-            # если соответствующего файла нет, то создаём
-            SV = line[:3]
-            if not (dict_SepObsFiles.get(SV)):
-                dict_SepObsFiles[SV] = open('{}/{}{}'.format(self.path, SV, self.__obsext__), 'w')
-                # заполнение шапки
-                dict_SepObsFiles[SV].write(';'.join(ObsTypes[gnss]) + '\n')
-                # заполнение пустых моментов времени
-                dict_SepObsFiles[SV].write((';' * len(ObsTypes[gnss]) + '\n') * num_obs)
-                # добавление в перечень для механизма записи пустых строк
-                list_ObsFilesForRemoving.append(dict_SepObsFiles[SV])
-            # записываем
-            SepObsFile = dict_SepObsFiles.get(SV)
-            list_obs = list(line[k:k + 13].strip() for k in range(4, len(line), 16))  # observations list
-            SepObsFile.write(';'.join(list_obs) + '\n')
-            list_ObsFilesForRemoving.remove(SepObsFile)  # удаляем имена файлов, в которых писали на этом такте
-
+            num_SV = int(line[1:3]) - 1
+            if num_SV >= cls.__svmax__[line[0]]:
+                continue  # номер вне диапазона ячеек
+            block = dict_block[line[0]]
+            chunk['SV'].add('{}{:02d}'.format(line[0], num_SV + 1))
+            list_obs = [float(line[k:k + 13].strip() or nan) for k in range(4, len(line), 16)]
+            block[num_obs, num_SV, :len(list_obs)] = list_obs[:block.shape[2]]
         # closing
         file_rinexobs.close()
-        for SepObsFile in dict_SepObsFiles.values():
-            SepObsFile.close()
-
-        # prn reading      
-        prntable = np.arange(30) * np.nan
-        if os.path.exists(os.getcwd() + '/' + rinex_file_name[:-1] + 'g'):
-            file_navinfo = open(rinex_file_name[:-1] + 'g')
-        elif os.path.exists(os.getcwd() + '/' + rinex_file_name[:-1] + 'G'):
-            file_navinfo = open(rinex_file_name[:-1] + 'G')
+        if num_rows:
+            flush()
+
+        # последний блок - до последней метки времени файла (при aggregate - до её интервала)
+        if aggregate is None:
+            size = (time_last + 1000 - time_start) // step + 1  # допуск 1 мкс, как у эпох сетки
         else:
-            file_navinfo = None
-        if file_navinfo != None:
-            flag_3str = 0
-            flag_header = True
-            for line in file_navinfo:
-                if flag_header:  # проматываем заголовок
-                    if 'END OF HEADER' in line:
-                        flag_header = False
-                    continue
-                if line[0] == 'R':  # начало блока с информацией о НКА ГЛОНАСС
-                    line = line.replace('R ', 'R0')  # защита от файлов с пробелом вместо нуля
-                    dat = line.split()
-                    num_SV = int(dat[0][1:])
-                    flag_3str = 3
-                flag_3str -= 1
-                if flag_3str == 0:  # строка с номером литеры
-                    try:
-                        prntable[num_SV - 1] = int(float(line[61:80].replace('D','E')))
-                    except ValueError:
-                        prntable[num_SV - 1] = int(float(line[61:63]))
-                    else:
-                        prntable[num_SV - 1]=np.nan
+            size = gridindex(time_last) + 1
+        tail['size'] = offset
+        while size > chunk['start'] + chunk_epochs:
+            chunk['tail'] = tail
+            chunk['stats'] = chunkstats()
+            yield chunk
+            chunk = newchunk(chunk['start'] + chunk_epochs)
+        if size > chunk['start']:
+            chunk['tail'] = tail
+            chunk['stats'] = chunkstats()
+            yield cutchunk(chunk, size - chunk['start'])
 
-            file_navinfo.close()  # закрываем файл с нав. информацией
-        # creation file with liter table
-        file_prntable = open(self.path + '/litertable.csv', 'w')
-        for prn in prntable:
-            file_prntable.write(str(prn) + '\n')
-        file_prntable.close()
+    @classmethod
+    def ingest(cls, list_files, session_name, processes=None, time_interval=30, chunk_epochs=2880, stats=None,
+               decimate=1, aggregate=None):
+        ''' Параллельное преобразование набора файлов RINEX 3 и объединение в один сеанс.
+        list_files - список файлов измерений или папка с ними (.o/.O, Hatanaka .d/.D, длинные имена ..._MO.rnx/.crx,
+        в т.ч. сжатые .gz/.Z/.bz2); навигационные файлы и .sp3 берутся рядом с файлами.
+        Файлы преобразуются в пуле процессов (processes - число процессов, по умолчанию число ядер),
+        затем раскладываются на общую сетку времени в папку session_name + .pygnss: пропуски между
+        файлами заполняются nan, в перекрытиях остаются измерения более раннего файла.
+        stats - как в PyGNSS(): статистика сеанса со стадиями convert (пул процессов) и merge;
+        decimate, aggregate - прореживание и свёртка эпох файлов (как в stream)
+        :return: PyGNSS объединённого сеанса'''
+        if isinstance(list_files, str):
+            list_files = [os.path.join(list_files, file_name) for file_name in sorted(os.listdir(list_files))
+                          if cls.__isobs__(file_name)]
+        time_start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            list(executor.map(_convert, list_files, [time_interval] * len(list_files), [decimate] * len(list_files),
+                              [aggregate] * len(list_files)))
+        time_convert = time.perf_counter() - time_start
+        time_start = time.perf_counter()
+        list_part = sorted((cls(file_name) for file_name in list_files), key=lambda part: part.__gridtime__[0])
 
-    def __parseEphemeris__(self, file_name):
-        ''' Ephemeris reading from sp3 file'''
+        ## Общая сетка времени
+        time_interval = list_part[0].__meta__['time_interval']
+        if any(abs(part.__meta__['time_interval'] - time_interval) > 1e-6 for part in list_part):
+            raise ValueError('Files have different time intervals')
+        time_start = list_part[0].__gridtime__[0]
+        list_start = [int(round((part.__gridtime__[0] - time_start) / time_interval)) for part in list_part]
+        size = max(start + len(part.__gridtime__) for start, part in zip(list_start, list_part))
+        path = os.path.abspath(session_name + cls.__pathext__)
+        os.mkdir(path)
+        np.save('{}/time.npy'.format(path), np.round(time_start + time_interval * np.arange(size), 6))
+
+        ## Описание сеанса: виды измерений - объединение видов всех файлов
+        manifest = {'version': cls.__version__, 'SV': [], 'obs_types': {gnss: [] for gnss in cls.__svmax__},
+                    'SV_max': cls.__svmax__, 'time_interval': float(time_interval), 'aggregate': aggregate,
+                    'SV_eph': [], 'eph_types': [],
+                    'litertable': [None] * max(len(part.__meta__['litertable']) for part in list_part)}
+        for part in list_part:
+            manifest['SV'].extend(SV_name for SV_name in part.SV_list_full if not (SV_name in manifest['SV']))
+            manifest['SV_eph'].extend(SV_name for SV_name in part.__meta__['SV_eph']
+                                      if not (SV_name in manifest['SV_eph']))
+            for gnss, obs_types in part.__meta__['obs_types'].items():
+                manifest['obs_types'][gnss].extend(obs_type for obs_type in obs_types
+                                                   if not (obs_type in manifest['obs_types'][gnss]))
+            manifest['eph_types'].extend(eph_type for eph_type in part.__meta__['eph_types']
+                                         if not (eph_type in manifest['eph_types']))
+            for num, prn in enumerate(part.__meta__['litertable']):
+                if manifest['litertable'][num] is None:
+                    manifest['litertable'][num] = prn
+        manifest['SV'].sort()
+        manifest['SV_eph'].sort()
+
+        ## Объединение измерений ГНСС
+        # блоками по chunk_epochs эпох общей сетки: дуги файлов собираются в плотный блок и упаковываются заново,
+        # память не зависит от длины файлов
+        for gnss in cls.__svmax__:
+            types = manifest['obs_types'][gnss]
+            list_src = [(start, part) for start, part in zip(list_start, list_part)
+                        if os.path.exists('{}/{}{}'.format(part.path, gnss, cls.__arcsext__))]
+            if not list_src:
+                continue
+            for num_obs in range(0, size, chunk_epochs):
+                block = np.full((min(chunk_epochs, size - num_obs), cls.__svmax__[gnss], len(types)), np.nan)
+                for start, part in list_src:
+                    window = slice(max(num_obs - start, 0), min(num_obs + len(block) - start, len(part.__gridtime__)))
+                    if window.stop <= window.start:
+                        continue
+                    ind = [types.index(obs_type) for obs_type in part.__meta__['obs_types'][gnss]]
+                    rows = slice(start + window.start - num_obs, start + window.stop - num_obs)
+                    dst = block[rows][:, :, ind]
+                    ind_fill = np.isnan(dst)
+                    dst[ind_fill] = part.__obsarcs__(gnss).dense(window)[ind_fill]
+                    block[rows, :, ind] = dst
+                cls.__arcsappend__(path, gnss, block, num_obs)
+
+        ## Объединение узлов эфемерид: в совпадающих узлах остаются значения более раннего файла
+        list_src = [part for part in list_part if os.path.exists('{}/ephtime.npy'.format(part.path))]
+        if list_src:
+            time_nodes = np.unique(np.concatenate([np.load('{}/ephtime.npy'.format(part.path)) for part in list_src]))
+            np.save('{}/ephtime.npy'.format(path), time_nodes)
+            for gnss in cls.__svmax__:
+                block = np.full((len(time_nodes), cls.__svmax__[gnss], len(manifest['eph_types'])), np.nan)
+                found = False
+                for part in list_src:
+                    if not (os.path.exists('{}/{}{}'.format(part.path, gnss, cls.__ephext__))):
+                        continue
+                    found = True
+                    rows = np.searchsorted(time_nodes, np.load('{}/ephtime.npy'.format(part.path)))
+                    ind = [manifest['eph_types'].index(eph_type) for eph_type in part.__meta__['eph_types']]
+                    dst = block[rows]
+                    ind_fill = np.isnan(dst[:, :, ind])
+                    dst[:, :, ind] = np.where(ind_fill, np.load('{}/{}{}'.format(part.path, gnss, cls.__ephext__)),
+                                              dst[:, :, ind])
+                    block[rows] = dst
+                if found:
+                    np.save('{}/{}{}'.format(path, gnss, cls.__ephext__), block)
 
-        # list time reading
+        ## Объединение записей навигационных файлов, повторы отбрасываются
+        for gnss in cls.__svmax__:
+            list_records = [np.load('{}/{}{}'.format(part.path, gnss, cls.__navext__)) for part in list_part
+                            if os.path.exists('{}/{}{}'.format(part.path, gnss, cls.__navext__))]
+            if list_records:
+                np.save('{}/{}{}'.format(path, gnss, cls.__navext__), np.unique(np.concatenate(list_records), axis=0))
+
+        with open('{}/{}'.format(path, cls.__manifest__), 'w') as file_manifest:
+            json.dump(manifest, file_manifest, indent=1)
+        time_merge = time.perf_counter() - time_start
+        session = cls(session_name, stats=stats)
+        session.__stage__('convert', time_convert, files=len(list_files),
+                          bytes_read=sum(os.path.getsize(file_name) for file_name in list_files))
+        session.__stage__('merge', time_merge, epochs=size)
+        return session
+
+    def __parseRINEX__(self, rinex_file_name, time_interval, decimate=1, aggregate=None):
+        ''' Разбор RINEX 3 за один проход: блоки stream дописываются в файлы папки'''
+        set_SV = set()
+        ObsTypes = {}
+        tail = None
+        chunk = {}
+        time_parse = time_write = 0.0
+        size_write = 0
+        time_start = time.perf_counter()
+        for chunk in self.stream(rinex_file_name, time_interval=time_interval, decimate=decimate, aggregate=aggregate):
+            time_chunk = time.perf_counter()
+            time_parse += time_chunk - time_start
+            if chunk['start'] == 0:
+                os.mkdir(self.path)
+            time_interval = chunk['time_interval']
+            ObsTypes = chunk['obs_types']
+            set_SV.update(chunk['SV'])
+            tail = chunk['tail']
+            self.__npyappend__('{}/time.npy'.format(self.path), chunk['time'])
+            size_write += chunk['time'].nbytes
+            for gnss, block in chunk['obs'].items():
+                size_write += self.__arcsappend__(self.path, gnss, block, chunk['start'])
+            time_start = time.perf_counter()
+            time_write += time_start - time_chunk
+        if not (os.path.exists(self.path)):
+            return
+        stats = chunk['stats']
+        num_rows = len(np.load('{}/time.npy'.format(self.path), mmap_mode='r'))
+        self.__stage__('header', stats['time_header'])
+        self.__stage__('parse', time_parse + time.perf_counter() - time_start - stats['time_header'],
+                       epochs=stats['epochs'], skipped=stats['skipped'], strptime=stats['strptime'],
+                       gaps=num_rows - stats['epochs'] + stats['skipped'], bytes_read=tail['size'])
+        self.__stage__('write', time_write, rows=num_rows, bytes_written=size_write)
+        time_start = time.perf_counter()
+
+        # навигационные файлы рядом с файлом измерений
+        list_nav = self.__navfiles__(rinex_file_name)
+        prntable, set_SVnav = np.full(self.__svmax__['R'], np.nan), set()
+        if list_nav:
+            prntable, set_SVnav = self.__parseNavigation__(list_nav)
+            self.__stage__('nav', time.perf_counter() - time_start, SV=len(set_SVnav),
+                           bytes_read=sum(os.path.getsize(file_name) for file_name in list_nav))
+        # описание папки
+        self.__savemanifest__({'version': self.__version__, 'SV': sorted(set_SV),
+                               'obs_types': {gnss: ObsTypes.get(gnss, []) for gnss in self.__svmax__},
+                               'SV_max': self.__svmax__, 'time_interval': float(time_interval),
+                               'aggregate': aggregate, 'SV_eph': sorted(set_SVnav),
+                               'eph_types': ['x', 'y', 'z', 'dt'] if set_SVnav else [],
+                               'litertable': [None if np.isnan(prn) else int(prn) for prn in prntable],
+                               'tail': dict(tail, sha1=self.__fingerprint__(rinex_file_name, tail))
+                               if self.__seekable__(rinex_file_name) else None})
+
+    def __parseNavigation__(self, list_files):
+        ''' Разбор навигационных файлов RINEX 3: записи эфемерид GPS, ГЛОНАСС и Galileo сохраняются
+        в массивы ГНСС {ГНСС}.nav.npy (записи x номер НКА, toc, опорное время орбиты, поля записи),
+        неисправные НКА (признак здоровья не 0) и повторы записей отбрасываются.
+        Время ГЛОНАСС (UTC) переводится в шкалу GPS по строке LEAP SECONDS заголовка.
+        :return: таблица литер ГЛОНАСС (номер НКА - 1, nan - неизвестна), множество НКА с записями'''
+        prntable = np.full(self.__svmax__['R'], np.nan)
+        dict_records = {gnss: [] for gnss in BroadcastEphemeris.__fields__}
+        field = lambda text: float(text.replace('D', 'E')) if text.strip() else 0.0  # пустое поле - 0
+        for file_name in list_files:
+            leap = 0
+            record = None
+            file_nav = self.__readlines__(file_name)
+            for line in file_nav:  # заголовок
+                if 'LEAP SECONDS' in line[60:]:
+                    leap = int(line[:6])
+                if 'END OF HEADER' in line[60:]:
+                    break
+            for line in file_nav:
+                if line[:4].strip():
+                    # первая строка записи - новый НКА, предыдущая запись готова
+                    if record is not None:
+                        dict_records[record[0]].append(record[1])
+                    record = None
+                    gnss = line[0]
+                    if not (gnss in dict_records) or (int(line[1:3]) > self.__svmax__[gnss]):
+                        continue  # прочие ГНСС
+                    epoch = datetime.strptime(line[4:23], '%Y %m %d %H %M %S')
+                    toc = epoch.timestamp() + (leap if gnss == 'R' else 0)
+                    # секунды недели GPS (с воскресенья) для привязки toe к шкале времени
+                    sow = ((epoch.weekday() + 1) % 7) * 86400 + epoch.hour * 3600 + epoch.minute * 60 + epoch.second
+                    record = (gnss, [int(line[1:3]), toc, sow] + [field(line[k:k + 19]) for k in (23, 42, 61)])
+                elif record is not None:
+                    record[1].extend(field(line[k:k + 19]) for k in (4, 23, 42, 61))
+            if record is not None:
+                dict_records[record[0]].append(record[1])
+            file_nav.close()
+
+        set_SV = set()
+        for gnss, list_records in dict_records.items():
+            size = BroadcastEphemeris.__fields__[gnss] + 3
+            block = np.array([record[:size] + [0.0] * (size - len(record)) for record in list_records]).reshape(-1, size)
+            block = np.unique(block[block[:, 3 + BroadcastEphemeris.__health__[gnss]] == 0], axis=0)
+            if not len(block):
+                continue
+            if gnss == 'R':
+                block[:, 2] = block[:, 1]
+                prntable[block[:, 0].astype(int) - 1] = block[:, 3 + 10]
+            else:
+                # toe - секунды недели, привязка к ближайшей неделе относительно toc
+                diff = block[:, 3 + 11] - block[:, 2]
+                block[:, 2] = block[:, 1] + diff - 604800 * np.round(diff / 604800)
+            np.save('{}/{}{}'.format(self.path, gnss, self.__navext__), block)
+            set_SV.update('{}{:02d}'.format(gnss, num) for num in np.unique(block[:, 0]).astype(int))
+        return prntable, set_SV
+
+    def __parseEphemeris__(self, file_name):
+        ''' Ephemeris reading from sp3 file: узлы хранятся на эпохах sp3 (ephtime.npy),
+        значения - в массивах ГНСС (узлы x НКА x x,y,z,dt)'''
+        eph_types = ['x', 'y', 'z', 'dt']
+        nan = float('nan')
+        time_start = time.perf_counter()
         list_time = []
-        file_time = open('{}/time.csv'.format(self.path))
-        for line in file_time:
-            list_time.append(datetime.fromtimestamp(float(line)))
-
-        # ephemeris reading
-        dict_SepObsFiles = {}
-        list_ObsFilesForRemoving = []
-        num_obs = 0
-        file_ephemeris = open(file_name)
+        dict_nodes = {gnss: [] for gnss in self.__svmax__}
+        set_SV = set()
+        file_ephemeris = self.__readlines__(file_name)
         for line in file_ephemeris:
             if line[0] == '*':
                 # timestamp
-                if not (datetime.strptime(line[3:22], '%Y %m %d %H %M %S') in list_time):
-                    continue
-                # поиск соответствующего номера наблюдения
-                kol_missed_obs = list_time.index(datetime.strptime(line[3:22],
-                                                                   '%Y %m %d %H %M %S')) - num_obs - 1  # для отработки пропущенных моментов времени
-                num_obs = list_time.index(datetime.strptime(line[3:22], '%Y %m %d %H %M %S'))
-                # Заполнение пустыми строками файлов, в которые не писали на прошлом такте
-                for SepObsFile in list_ObsFilesForRemoving:
-                    SepObsFile.write('\n')
-                # Заполнение пустыми строками пропусков в измерениях
-                for SepObsFile in dict_SepObsFiles.values():
-                    for k in range(kol_missed_obs):
-                        SepObsFile.write('\n')
-                # новая инициализация списка имён файлов для механизма записи пустых строк
-                list_ObsFilesForRemoving = list(dict_SepObsFiles.values())
-                continue
+                list_time.append(datetime.strptime(line[3:22], '%Y %m %d %H %M %S').timestamp())
+                for gnss, list_nodes in dict_nodes.items():
+                    list_nodes.append(np.full((self.__svmax__[gnss], len(eph_types)), nan))
             # остальные строки
-            elif line[0] == 'P':
-                # запись наблюдений в отдельный файл
-                SV = line[1:4]
-                if SV[1] == ' ':
-                    SV = SV[0] + '0' + SV[2:]
-                # если соответствующего файла нет, то создаём
-                if not (dict_SepObsFiles.get(SV)):
-                    dict_SepObsFiles[SV] = open('{}/{}{}'.format(self.path, SV, self.__ephext__), 'w')
-                    # заполнение шапки
-                    dict_SepObsFiles[SV].write(';'.join(['x', 'y', 'z', 'dt']) + '\n')
-                    # заполнение пустых моментов времени
-                    dict_SepObsFiles[SV].write((';' * 4 + '\n') * num_obs)
-                    # добавление в перечень для механизма записи пустых строк
-                    list_ObsFilesForRemoving.append(dict_SepObsFiles[SV])
-                # записываем
-                SepObsFile = dict_SepObsFiles.get(SV)
-                list_eph = list(line[k:k + 13].strip() for k in range(5, len(line), 14))  # ephemeris list
-                SepObsFile.write(';'.join(list_eph) + '\n')
-                list_ObsFilesForRemoving.remove(SepObsFile)  # удаляем имена файлов, в которых писали на этом такте
-
+            elif (line[0] == 'P') and list_time and (line[1] in self.__svmax__):
+                num_SV = int(line[2:4]) - 1
+                if num_SV >= self.__svmax__[line[1]]:
+                    continue  # номер вне диапазона ячеек
+                set_SV.add('{}{:02d}'.format(line[1], num_SV + 1))
+                list_eph = [float(line[k:k + 13].strip() or nan) for k in range(5, len(line), 14)]  # ephemeris list
+                dict_nodes[line[1]][-1][num_SV, :len(list_eph)] = list_eph[:len(eph_types)]
         # closing
         file_ephemeris.close()
-        for SepObsFile in dict_SepObsFiles.values():
-            SepObsFile.close()
+
+        ind = np.argsort(list_time, kind='stable')
+        np.save('{}/ephtime.npy'.format(self.path), np.array(list_time)[ind])
+        size_write = 8 * len(list_time)
+        for gnss in {SV_name[0] for SV_name in set_SV}:
+            block = np.array(dict_nodes[gnss])[ind]
+            # отсутствующие значения sp3: координаты 0.000000, часы 999999.999999
+            block[(block[:, :, :3] == 0).all(axis=2), :3] = nan
+            block[block[:, :, 3] >= 999999, 3] = nan
+            np.save('{}/{}{}'.format(self.path, gnss, self.__ephext__), block)
+            size_write += block.nbytes
+
+        manifest = self.__loadmanifest__()
+        # НКА ГНСС без sp3 остаются с бортовыми эфемеридами
+        set_gnss = {SV_name[0] for SV_name in set_SV}
+        manifest['SV_eph'] = sorted(set_SV.union(SV_name for SV_name in manifest['SV_eph']
+                                                 if not (SV_name[0] in set_gnss)))
+        manifest['eph_types'] = eph_types
+        self.__savemanifest__(manifest)
+        self.__stage__('sp3', time.perf_counter() - time_start, nodes=len(list_time), SV=len(set_SV),
+                       bytes_read=os.path.getsize(file_name), bytes_written=size_write)
+
+    @staticmethod
+    def __npyappend__(file_name, array, start=None):
+        ''' Дозапись массива в файл .npy по первой оси; заголовок с размером обновляется на месте
+        (np.save оставляет в нём запас под рост первой размерности).
+        start - номер строки, с которой записывается массив (последующие строки заменяются), по умолчанию - в конец'''
+        if not (os.path.exists(file_name)):
+            np.save(file_name, array)
+            return
+        with open(file_name, 'r+b') as file_npy:
+            version = np.lib.format.read_magic(file_npy)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file_npy)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file_npy)
+            size_header = file_npy.tell()
+            if (shape[1:] != array.shape[1:]) or fortran_order:
+                raise ValueError('Incompatible array shape for appending to {}'.format(file_name))
+            if start is None:
+                start = shape[0]
+            file_npy.seek(0)
+            header = {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False,
+                      'shape': (start + len(array),) + shape[1:]}
+            if version == (1, 0):
+                np.lib.format.write_array_header_1_0(file_npy, header)
+            else:
+                np.lib.format.write_array_header_2_0(file_npy, header)
+            if file_npy.tell() != size_header:
+                raise ValueError('No space in {} header for appending'.format(file_name))
+            # файл не укорачивается: отображения прежнего размера остаются действительными
+            file_npy.seek(size_header + start * dtype.itemsize * int(np.prod(shape[1:], dtype=int)))
+            file_npy.write(np.ascontiguousarray(array, dtype=dtype).tobytes())
+
+    @classmethod
+    def __arcsappend__(cls, path, gnss, block, start):
+        ''' Дозапись блока эпох block (эпохи x НКА x виды измерений) с эпохи start сетки в дуги ГНСС папки path.
+        Дуги делятся на границах блоков сетки по __arcschunk__ эпох, переписываются только дуги блока сетки,
+        в который попадает start: измерения эпох с start заменяются (refresh перечитывает последнюю эпоху),
+        дуга, которую продолжают новые эпохи, продлевается, строки дуг блока пишутся заново вместе с новыми.
+        Таблица дуг читается с конца - до дуг прежних блоков сетки.
+        :return: число записанных байт'''
+        file_rows = '{}/{}{}'.format(path, gnss, cls.__obsext__)
+        file_arcs = '{}/{}{}'.format(path, gnss, cls.__arcsext__)
+        boundary = start // cls.__arcschunk__ * cls.__arcschunk__
+        arcs_tail = np.zeros((0, 4), dtype=np.int64)
+        num_arcs = offset = 0
+        if os.path.exists(file_arcs):
+            arcs = np.load(file_arcs, mmap_mode='r')
+            size = 64
+            while True:
+                # дуги прежних блоков сетки заканчиваются не позже boundary
+                arcs_tail = np.array(arcs[max(len(arcs) - size, 0):])
+                ind = np.flatnonzero(arcs_tail[:, 2] <= boundary)
+                if len(ind) or (len(arcs_tail) == len(arcs)):
+                    break
+                size *= 2
+            if len(ind):
+                arcs_tail = arcs_tail[ind[-1] + 1:]
+            num_arcs = len(arcs) - len(arcs_tail)
+            if num_arcs:
+                offset = int(arcs[num_arcs - 1, 3] + arcs[num_arcs - 1, 2] - arcs[num_arcs - 1, 1])
+            del arcs
+        # дуги блока сетки до start: ячейка, первая эпоха, эпоха после последней и куски строк
+        arcs_tail = arcs_tail[arcs_tail[:, 1] < start]
+        list_rows = []
+        if len(arcs_tail):
+            rows = np.load(file_rows, mmap_mode='r')
+            arcs_tail[:, 2] = np.minimum(arcs_tail[:, 2], start)
+            list_rows = [[np.array(rows[arc[3]:arc[3] + arc[2] - arc[1]])] for arc in arcs_tail.tolist()]
+            del rows
+        list_arcs = arcs_tail[:, :3].tolist()
+        dict_end = {(cell, stop): num for num, (cell, first, stop) in enumerate(list_arcs)}
+        # новые эпохи - по блокам сетки; дуга, начатая на start, продолжает дугу, закончившуюся на start
+        first_block = start
+        while first_block < start + len(block):
+            stop_block = min(first_block // cls.__arcschunk__ * cls.__arcschunk__ + cls.__arcschunk__,
+                             start + len(block))
+            arcs, rows = ObsArcs.pack(block[first_block - start:stop_block - start], first_block)
+            for cell, first, stop, row in arcs.tolist():
+                num = dict_end.pop((cell, first), None)
+                if num is None:
+                    list_arcs.append([cell, first, stop])
+                    list_rows.append([rows[row:row + stop - first]])
+                else:
+                    list_arcs[num][2] = stop
+                    list_rows[num].append(rows[row:row + stop - first])
+            first_block = stop_block
+        # порядок дуг - по блокам сетки и ячейкам, строки дуг - подряд в том же порядке
+        order = sorted(range(len(list_arcs)),
+                       key=lambda num: (list_arcs[num][1] // cls.__arcschunk__, list_arcs[num][0], list_arcs[num][1]))
+        arcs_new = np.array([list_arcs[num] for num in order], dtype=np.int64).reshape(-1, 3)
+        rows_new = np.concatenate([np.zeros((0, block.shape[2]))] + [rows for num in order for rows in list_rows[num]])
+        lengths = arcs_new[:, 2] - arcs_new[:, 1]
+        arcs_new = np.column_stack((arcs_new, offset + np.cumsum(lengths) - lengths))
+        cls.__npyappend__(file_rows, rows_new, offset)
+        cls.__npyappend__(file_arcs, arcs_new, num_arcs)
+        return rows_new.nbytes + arcs_new.nbytes
 
 # ---------------- конец класса
+
+
+class ObsArcs:
+    ''' Измерения ГНСС по дугам видимости: строки измерений (эпохи, на которых у НКА есть измерения,
+    x виды измерений) хранятся подряд по дугам, таблица дуг - ячейка НКА, первая эпоха, эпоха после последней,
+    номер первой строки. Плотный вид (эпохи x НКА x виды, nan вне дуг) собирается по запросу'''
+
+    def __init__(self, arcs, rows, shape):
+        self.arcs = arcs  # дуги x (ячейка, start, stop, offset)
+        self.rows = rows
+        self.shape = tuple(shape)  # форма плотного вида: эпохи сетки, ячейки НКА, виды измерений
+
+    @staticmethod
+    def pack(block, start=0, offset=0):
+        ''' Дуги блока эпох block (эпохи x НКА x виды), start - номер первой эпохи блока на сетке,
+        offset - номер первой строки.
+        :return: таблица дуг, строки (НКА по порядку, эпохи дуги подряд)'''
+        visible = ~np.isnan(block).all(axis=2).T  # НКА x эпохи
+        edges = np.diff(visible.astype(np.int8), axis=1, prepend=0, append=0)
+        cells, first = np.nonzero(edges == 1)
+        stop = np.nonzero(edges == -1)[1]
+        lengths = stop - first
+        arcs = np.column_stack((cells, first + start, stop + start, offset + np.cumsum(lengths) - lengths))
+        return arcs.astype(np.int64).reshape(-1, 4), block.transpose(1, 0, 2)[visible]
+
+    def index(self, window=slice(None), cells=None):
+        ''' Измерения дуг в эпохах window (срез сетки) для ячеек cells (номер или список, None - все):
+        номера эпох окна, ячейки НКА, номера строк измерений'''
+        start, stop, _ = window.indices(self.shape[0])
+        stop = max(stop, start)
+        ind = (self.arcs[:, 1] < stop) & (self.arcs[:, 2] > start)
+        if cells is not None:
+            ind &= np.isin(self.arcs[:, 0], cells)
+        arcs = self.arcs[ind]
+        first = np.maximum(arcs[:, 1], start)
+        lengths = np.minimum(arcs[:, 2], stop) - first
+        pos = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)  # номер в своей дуге
+        return (np.repeat(first - start, lengths) + pos, np.repeat(arcs[:, 0], lengths),
+                np.repeat(arcs[:, 3] + first - arcs[:, 1], lengths) + pos)
+
+    def dense(self, window=slice(None), cell=None):
+        ''' Плотный массив эпох window (срез сетки): эпохи x НКА x виды, для ячейки cell - эпохи x виды'''
+        start, stop, _ = window.indices(self.shape[0])
+        epochs, cells, rows = self.index(window, cell)
+        if cell is not None:
+            block = np.full((max(stop - start, 0), self.shape[2]), np.nan)
+            block[epochs] = self.rows[rows]
+        else:
+            block = np.full((max(stop - start, 0),) + self.shape[1:], np.nan)
+            block[epochs, cells] = self.rows[rows]
+        return block
+
+    def summary(self):
+        ''' Наличие видов измерений (НКА x виды), первая и последняя эпохи с измерениями (-1 - нет) по ячейкам НКА'''
+        present = np.zeros(self.shape[1:], dtype=bool)
+        first = np.full(self.shape[1], self.shape[0])
+        last = np.full(self.shape[1], -1)
+        if len(self.arcs):
+            np.logical_or.at(present, self.arcs[:, 0],
+                             np.logical_or.reduceat(~np.isnan(self.rows[:self.arcs[-1, 3] + self.arcs[-1, 2] -
+                                                                        self.arcs[-1, 1]]), self.arcs[:, 3]))
+            np.minimum.at(first, self.arcs[:, 0], self.arcs[:, 1])
+            np.maximum.at(last, self.arcs[:, 0], self.arcs[:, 2] - 1)
+        first[first == self.shape[0]] = -1
+        return present, first, last
+
+
+class LagrangeInterpolator:
+    ''' Интерполяция полиномом Лагранжа по скользящему окну из order + 1 узлов.
+    Значения всех НКА и компонент вычисляются одной операцией, веса окон запоминаются
+    для нескольких последних сеток моментов запроса. Для НКА с пропусками (nan) в узлах окна строятся
+    только по его действительным узлам; пропуск длиннее __gapnodes__ узлов делит узлы НКА на участки,
+    которые интерполируются порознь (окна у края участка - односторонние), внутри пропуска - nan'''
+    __cachesize__ = 4  # число запоминаемых сеток
+    __gapsize__ = 64  # число запоминаемых наборов действительных узлов НКА с пропусками
+    __gapnodes__ = 2  # наибольшее число пропущенных подряд узлов в окне НКА
+    __chunk__ = 8192  # число моментов, обрабатываемых за раз
+
+    def __init__(self, time_nodes, order=9):
+        self.time_nodes = np.asarray(time_nodes, dtype=float)
+        self.order = max(min(order, len(self.time_nodes) - 1), 0)
+        self.__weights__ = {}
+        self.__gaps__ = {}  # интерполяторы по действительным узлам НКА с пропусками
+        self.step = float(np.median(np.diff(self.time_nodes))) if len(self.time_nodes) > 1 else 0.0  # шаг узлов
+        # знаменатели весов prod (t_j - t_m), m != j, для всех положений окна
+        num = self.order + 1
+        windows = self.time_nodes[np.arange(len(self.time_nodes) - num + 1)[:, None] + np.arange(num)]
+        diff = windows[:, :, None] - windows[:, None, :]
+        diff[:, np.arange(num), np.arange(num)] = 1
+        self.__denom__ = diff.prod(axis=2)
+
+    def weights(self, time_query):
+        ''' Номера первых узлов окон и веса узлов (моменты x order + 1)'''
+        time_query = np.ascontiguousarray(time_query, dtype=float).ravel()
+        key = hashlib.sha1(time_query.tobytes()).digest()
+        if key in self.__weights__:
+            return self.__weights__[key]
+        num = self.order + 1
+        # веса считаются только для моментов внутри узлов (вне узлов и nan - веса nan)
+        cells = np.flatnonzero((time_query >= self.time_nodes[0]) & (time_query <= self.time_nodes[-1]))
+        ind = np.zeros(len(time_query), dtype=int)
+        weights = np.full((len(time_query), num), np.nan)
+        ind[cells] = np.clip(np.searchsorted(self.time_nodes, time_query[cells]) - num // 2,
+                             0, len(self.time_nodes) - num)
+        # w_j = prod (t - t_m) / (t_j - t_m), m != j = prod (t - t_m) / (t - t_j) / знаменатель окна
+        diff = time_query[cells, None] - self.time_nodes[ind[cells, None] + np.arange(num)]
+        exact = diff == 0  # момент совпадает с узлом
+        diff[exact] = 1
+        weights_cells = diff.prod(axis=1)[:, None] / (diff * self.__denom__[ind[cells]])
+        ind_exact = exact.any(axis=1)
+        weights_cells[ind_exact] = exact[ind_exact]
+        weights[cells] = weights_cells
+        if len(self.__weights__) >= self.__cachesize__:
+            self.__weights__.pop(next(iter(self.__weights__)))
+        self.__weights__[key] = (ind, weights)
+        return ind, weights
+
+    def __call__(self, values, time_query):
+        ''' values - значения в узлах (узлы x НКА x компоненты);
+        time_query - (моменты) общие для всех НКА или (моменты x НКА) - свои для каждого НКА.
+        Узел с nan в какой-либо компоненте НКА пропускается: окна этого НКА строятся по остальным узлам;
+        пропуск длиннее __gapnodes__ узлов не интерполируется (nan).
+        :return: массив (моменты x НКА x компоненты)'''
+        time_query = np.asarray(time_query, dtype=float)
+        result = self.__interpolate__(values, time_query)
+        # НКА с пропусками в узлах считаются заново по своим действительным узлам
+        gaps = np.isnan(values).any(axis=2)
+        for num_SV in np.flatnonzero(gaps.any(axis=0) & ~gaps.all(axis=0)):
+            valid = ~gaps[:, num_SV]
+            key = valid.tobytes()
+            list_parts = self.__gaps__.get(key)
+            if list_parts is None:
+                if len(self.__gaps__) >= self.__gapsize__:
+                    self.__gaps__.pop(next(iter(self.__gaps__)))
+                # участки действительных узлов между длинными пропусками: (номера узлов, интерполятор)
+                ind_valid = np.flatnonzero(valid)
+                bounds = np.flatnonzero(np.diff(self.time_nodes[ind_valid]) >
+                                        (self.__gapnodes__ + 1.5) * self.step) + 1
+                list_parts = self.__gaps__[key] = [(ind, LagrangeInterpolator(self.time_nodes[ind], self.order))
+                                                   for ind in np.split(ind_valid, bounds)]
+            times = time_query if time_query.ndim == 1 else time_query[:, num_SV]
+            result_SV = np.full((len(times),) + values.shape[2:], np.nan)
+            for ind, interp in list_parts:
+                cells = (times >= interp.time_nodes[0]) & (times <= interp.time_nodes[-1])
+                result_SV[cells] = interp.__interpolate__(values[ind, num_SV:num_SV + 1], times[cells])[:, 0]
+            result[:, num_SV] = result_SV
+        return result
+
+    def __interpolate__(self, values, time_query):
+        ''' Интерполяция по всем узлам, nan в любом узле окна даёт nan'''
+        ind, weights = self.weights(time_query)
+        num = weights.shape[1]
+        if time_query.ndim == 1:
+            # моменты с общим окном узлов считаются одним матричным умножением
+            shape = values.shape[1:]
+            values = values.reshape(len(values), -1)
+            result = np.empty((len(ind), values.shape[1]))
+            perm = np.argsort(ind, kind='stable')
+            ind_sorted = ind[perm]
+            bounds = np.concatenate(([0], np.flatnonzero(np.diff(ind_sorted)) + 1, [len(ind)]))
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                rows = perm[start:end]
+                result[rows] = weights[rows] @ values[ind_sorted[start]:ind_sorted[start] + num]
+            return result.reshape((len(ind),) + shape)
+        # свои моменты для каждого НКА: окна узлов выбираются одной выборкой, только для моментов внутри узлов
+        result = np.full((len(ind), values.shape[2]), np.nan)
+        cells = np.flatnonzero(~np.isnan(weights[:, 0]))
+        ind_SV = cells % values.shape[1]
+        for start in range(0, len(cells), self.__chunk__):
+            chunk = slice(start, start + self.__chunk__)
+            window = values[ind[cells[chunk], None] + np.arange(num), ind_SV[chunk, None]]
+            result[cells[chunk]] = np.einsum('nj,njk->nk', weights[cells[chunk]], window)
+        return result.reshape(time_query.shape + values.shape[2:])
+
+
+class BroadcastEphemeris:
+    ''' Положения и часы НКА по записям навигационных файлов RINEX 3 (бортовые эфемериды), км и мкс.
+    GPS и Galileo - кеплеровы элементы с поправками (IS-GPS-200), ГЛОНАСС - интегрирование
+    вектора состояния в ПЗ-90 с учётом J2 методом Рунге-Кутты 4-го порядка (ИКД ГЛОНАСС):
+    все записи интегрируются один раз в узлы через __step__ секунд, между узлами - полином Лагранжа.
+    Для каждой ячейки (момент, НКА) берётся ближайшая по опорному времени запись, не дальше __age__;
+    все ячейки вычисляются одновременно блоками по __chunk__ ячеек.
+    Часы НКА - полином записи, без релятивистской поправки и групповых задержек (как часы sp3)'''
+    __fields__ = {'G': 31, 'R': 15, 'E': 31}  # число полей записи (кроме номера НКА и времени)
+    __health__ = {'G': 24, 'R': 6, 'E': 24}  # номер поля признака здоровья
+    __age__ = {'G': 7200, 'R': 900, 'E': 14400}  # наибольшее удаление момента от опорного времени записи, с
+    __mu__ = {'G': 3.986005e14, 'R': 3.9860044418e14, 'E': 3.986004418e14}  # гравитационный параметр, м^3/с^2
+    __omega__ = {'G': 7.2921151467e-5, 'R': 7.292115e-5, 'E': 7.2921151467e-5}  # вращение Земли, рад/с
+    __ae__ = 6378136.0  # экваториальный радиус ПЗ-90, м
+    __J2__ = 1.08262575e-3
+    __step__ = 60  # шаг интегрирования и узлов орбит ГЛОНАСС, с
+    __order__ = 7  # порядок интерполяции между узлами орбит ГЛОНАСС
+    __chunk__ = 65536  # число ячеек, вычисляемых за раз
+
+    def __init__(self, records, gnss):
+        ''' records - массив записей ГНСС (записи x номер НКА, toc, опорное время, поля записи)'''
+        self.records = np.asarray(records, dtype=float)
+        self.gnss = gnss
+        # записи каждого НКА по возрастанию опорного времени
+        self.__rows__ = {}
+        for num in np.unique(self.records[:, 0]).astype(int):
+            rows = np.flatnonzero(self.records[:, 0] == num)
+            self.__rows__[num] = rows[np.argsort(self.records[rows, 2], kind='stable')]
+        if gnss == 'R':
+            self.__nodes__ = self.__integrate__()
+            # знаменатели весов Лагранжа для равноотстоящих узлов окна
+            diff = np.arange(self.__order__ + 1)[:, None] - np.arange(self.__order__ + 1)
+            diff[np.diag_indices_from(diff)] = 1
+            self.__denom__ = diff.prod(axis=1).astype(float)
+
+    def select(self, time_query):
+        ''' Номера записей для ячеек (моменты x НКА), -1 - нет записи не дальше __age__ (и для nan)'''
+        ind_record = np.full(time_query.shape, -1)
+        for num, rows in self.__rows__.items():
+            if num > time_query.shape[1]:
+                continue
+            column = time_query[:, num - 1]
+            time_ref = self.records[rows, 2]
+            ind = np.searchsorted(time_ref, column)
+            left, right = np.maximum(ind - 1, 0), np.minimum(ind, len(rows) - 1)
+            nearest = np.where(np.abs(column - time_ref[left]) <= np.abs(time_ref[right] - column), left, right)
+            valid = np.abs(column - time_ref[nearest]) <= self.__age__[self.gnss]
+            ind_record[valid, num - 1] = rows[nearest[valid]]
+        return ind_record
+
+    def __call__(self, time_query, num_SV):
+        ''' time_query - (моменты) общие для всех num_SV ячеек НКА или (моменты x НКА) - свои для каждого НКА.
+        :return: массив (моменты x НКА x x,y,z,dt), без записи - nan'''
+        time_query = np.asarray(time_query, dtype=float)
+        if time_query.ndim == 1:
+            time_query = np.broadcast_to(time_query[:, None], (len(time_query), num_SV))
+        ind_record = self.select(time_query)
+        result = np.full(time_query.shape + (4,), np.nan)
+        cells = np.nonzero(ind_record >= 0)
+        propagate = self.__glonass__ if self.gnss == 'R' else self.__kepler__
+        for start in range(0, len(cells[0]), self.__chunk__):
+            chunk = tuple(ind[start:start + self.__chunk__] for ind in cells)
+            result[chunk] = propagate(ind_record[chunk], time_query[chunk])
+        return result
+
+    def __kepler__(self, ind_record, time_query):
+        ''' Кеплерово движение с поправками GPS/Galileo по записям ind_record: (ячейки x x,y,z,dt)'''
+        records = self.records[ind_record]
+        field = records[:, 3:].T
+        omega = self.__omega__[self.gnss]
+        tk = time_query - records[:, 2]
+        axis = field[10] ** 2
+        ecc = field[8]
+        anomaly = field[6] + (np.sqrt(self.__mu__[self.gnss] / axis ** 3) + field[5]) * tk
+        ecc_anomaly = anomaly
+        for _ in range(8):  # уравнение Кеплера, для e < 0.03 - сходимость до 1e-12
+            ecc_anomaly = anomaly + ecc * np.sin(ecc_anomaly)
+        arg = np.arctan2(np.sqrt(1 - ecc ** 2) * np.sin(ecc_anomaly), np.cos(ecc_anomaly) - ecc) + field[17]
+        sin2, cos2 = np.sin(2 * arg), np.cos(2 * arg)
+        arg += field[9] * sin2 + field[7] * cos2
+        radius = axis * (1 - ecc * np.cos(ecc_anomaly)) + field[4] * sin2 + field[16] * cos2
+        inclination = field[15] + field[14] * sin2 + field[12] * cos2 + field[19] * tk
+        node = field[13] + (field[18] - omega) * tk - omega * field[11]
+        x, y = radius * np.cos(arg), radius * np.sin(arg)
+        y_plane = y * np.cos(inclination)
+        clock = time_query - records[:, 1]
+        return np.column_stack(((x * np.cos(node) - y_plane * np.sin(node)) * 1e-3,
+                                (x * np.sin(node) + y_plane * np.cos(node)) * 1e-3,
+                                y * np.sin(inclination) * 1e-3,
+                                (field[0] + field[1] * clock + field[2] * clock ** 2) * 1e6))
+
+    def __integrate__(self):
+        ''' Узлы орбит ГЛОНАСС: вектор состояния каждой записи интегрируется от toc вперёд и назад
+        с шагом __step__ на __age__ секунд: (записи x узлы x x,y,z), м'''
+        num = int(np.ceil(self.__age__['R'] / self.__step__))
+        field = self.records[:, 3:]
+        acc = field[:, [5, 9, 13]] * 1e3  # ускорения от Луны и Солнца, постоянные на интервале
+        nodes = np.empty((len(field), 2 * num + 1, 3))
+        nodes[:, num] = field[:, [3, 7, 11]] * 1e3
+        for step in (self.__step__, -self.__step__):
+            pos, vel = field[:, [3, 7, 11]] * 1e3, field[:, [4, 8, 12]] * 1e3
+            for k in range(1, num + 1):
+                acc1 = self.__pz90__(pos, vel, acc)
+                vel2 = vel + step / 2 * acc1
+                acc2 = self.__pz90__(pos + step / 2 * vel, vel2, acc)
+                vel3 = vel + step / 2 * acc2
+                acc3 = self.__pz90__(pos + step / 2 * vel2, vel3, acc)
+                vel4 = vel + step * acc3
+                acc4 = self.__pz90__(pos + step * vel3, vel4, acc)
+                pos = pos + step / 6 * (vel + 2 * vel2 + 2 * vel3 + vel4)
+                vel = vel + step / 6 * (acc1 + 2 * acc2 + 2 * acc3 + acc4)
+                nodes[:, num + (k if step > 0 else -k)] = pos
+        return nodes
+
+    def __glonass__(self, ind_record, time_query):
+        ''' Положения ГЛОНАСС по узлам орбит записей ind_record, часы по записям: (ячейки x x,y,z,dt)'''
+        num = self.__order__ + 1
+        tk = time_query - self.records[ind_record, 1]
+        grid = tk / self.__step__ + self.__nodes__.shape[1] // 2  # положение момента среди узлов записи
+        first = np.clip(np.floor(grid).astype(int) - num // 2 + 1, 0, self.__nodes__.shape[1] - num)
+        diff = grid[:, None] - (first[:, None] + np.arange(num))
+        exact = diff == 0  # момент совпадает с узлом
+        diff[exact] = 1
+        weights = diff.prod(axis=1)[:, None] / (diff * self.__denom__)
+        ind_exact = exact.any(axis=1)
+        weights[ind_exact] = exact[ind_exact]
+        pos = np.einsum('nj,njk->nk', weights, self.__nodes__[ind_record[:, None], first[:, None] + np.arange(num)])
+        # часы: в записи -TauN и +GammaN
+        field = self.records[ind_record, 3:]
+        return np.column_stack((pos * 1e-3, (field[:, 0] + field[:, 1] * tk) * 1e6))
+
+    def __pz90__(self, pos, vel, acc):
+        ''' Ускорение НКА ГЛОНАСС во вращающейся системе ПЗ-90: центральное поле, J2,
+        центробежное и кориолисово ускорения, м/с^2'''
+        mu, omega = self.__mu__['R'], self.__omega__['R']
+        r2 = (pos ** 2).sum(axis=1)
+        central = mu / (r2 * np.sqrt(r2))
+        oblate = 1.5 * self.__J2__ * mu * self.__ae__ ** 2 / (r2 * r2 * np.sqrt(r2))
+        z2 = 5 * pos[:, 2] ** 2 / r2
+        result = np.empty_like(pos)
+        result[:, 0] = (omega ** 2 - central - oblate * (1 - z2)) * pos[:, 0] + 2 * omega * vel[:, 1]
+        result[:, 1] = (omega ** 2 - central - oblate * (1 - z2)) * pos[:, 1] - 2 * omega * vel[:, 0]
+        result[:, 2] = (-central - oblate * (3 - z2)) * pos[:, 2]
+        return result + acc
+
+
+class SVQuery:
+    ''' Условие отбора НКА по таблице свойств (PyGNSS.SVtable); условия объединяются &, |, ~
+    и проверяются для всех НКА сразу.
+    Параметры (несколько - по И):
+        gnss='GR' - ГНСС из списка
+        name, num, prn, fullname - значение или набор значений (список, range)
+        obs='L2P' или список - есть все указанные виды измерений
+        visible=(start, end) - есть измерения в интервале времени (datetime, float или None)
+    SVQuery.between(column, low, high) - значение столбца в диапазоне (включительно)'''
+
+    def __init__(self, condition=None, **options):
+        self.__conditions__ = [] if condition is None else [condition]
+        for key, value in options.items():
+            if key == 'gnss':
+                self.__conditions__.append(lambda table, value=list(value): self.__isin__(table['gnss'], value))
+            elif key == 'obs':
+                value = [value] if isinstance(value, str) else list(value)
+                self.__conditions__.append(lambda table, value=value: np.all(
+                    [table['obs'][:, table['obs_types'].index(obs_type)] if obs_type in table['obs_types']
+                     else np.zeros(len(table['name']), dtype=bool) for obs_type in value], axis=0))
+            elif key == 'visible':
+                start, end = [temp.timestamp() if isinstance(temp, datetime) else temp for temp in value]
+                self.__conditions__.append(lambda table, start=start, end=end:
+                                           (table['last'] >= (-np.inf if start is None else start)) &
+                                           (table['first'] <= (np.inf if end is None else end)))
+            elif isinstance(value, (str, int, float)):
+                self.__conditions__.append(lambda table, key=key, value=value: table[key] == value)
+            else:
+                self.__conditions__.append(lambda table, key=key, value=list(value): self.__isin__(table[key], value))
+
+    @staticmethod
+    def __isin__(column, value):
+        # для коротких наборов сравнения быстрее np.isin (сортировка)
+        if len(value) > 16:
+            return np.isin(column, value)
+        mask = np.zeros(len(column), dtype=bool)
+        for temp in value:
+            mask |= column == temp
+        return mask
+
+    @classmethod
+    def between(cls, column, low=None, high=None):
+        return cls(lambda table: (table[column] >= (-np.inf if low is None else low)) &
+                                 (table[column] <= (np.inf if high is None else high)))
+
+    def __call__(self, table):
+        ''' Маска НКА таблицы, удовлетворяющих условию'''
+        mask = np.ones(len(table['name']), dtype=bool)
+        for condition in self.__conditions__:
+            mask &= condition(table)
+        return mask
+
+    def __and__(self, other):
+        return SVQuery(lambda table: self(table) & other(table))
+
+    def __or__(self, other):
+        return SVQuery(lambda table: self(table) | other(table))
+
+    def __invert__(self):
+        return SVQuery(lambda table: ~self(table))
+
+
+class TimeAxis:
+    ''' Вектор времени типа datetime поверх массива меток времени float (без копирования):
+    datetime создаются только при обращении к элементам'''
+
+    def __init__(self, vct_timestamp):
+        self.timestamp = vct_timestamp
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return datetime.fromtimestamp(float(self.timestamp[key]))
+        return TimeAxis(self.timestamp[key])  # срез - тоже вектор времени
+
+    def __iter__(self):
+        for num_obs in range(0, len(self.timestamp), 4096):
+            yield from map(datetime.fromtimestamp, self.timestamp[num_obs:num_obs + 4096].tolist())
+
+    def __array__(self, dtype=None, copy=None):
+        return self.datetime64() if dtype is None else self.datetime64().astype(dtype)
+
+    def datetime64(self):
+        ''' Массив datetime64[us] тех же моментов, что и datetime элементов (местное время), без создания
+        datetime на каждую эпоху: сдвиг местного времени считается один раз на каждый час'''
+        stamp = np.round(np.asarray(self.timestamp, dtype=float) * 1e6).astype(np.int64)
+        hours, ind = np.unique(stamp // 3600000000, return_inverse=True)
+        shift = np.array([(datetime.fromtimestamp(hour * 3600) -
+                           datetime.fromtimestamp(hour * 3600, timezone.utc).replace(tzinfo=None)) //
+                          timedelta(microseconds=1) for hour in hours.tolist()], dtype=np.int64)
+        return (stamp + shift[ind].reshape(stamp.shape)).astype('datetime64[us]')
+
+    def __repr__(self):
+        if len(self) > 6:
+            return 'TimeAxis([{}, {}, ..., {}], len={})'.format(self[0], self[1], self[-1], len(self))
+        return 'TimeAxis({})'.format(self.tolist())
+
+    def tolist(self):
+        return list(self)
+
+    def index(self, timestamp):
+        ''' Номер эпохи timestamp (datetime или float)'''
+        if isinstance(timestamp, datetime):
+            timestamp = timestamp.timestamp()
+        num_obs = int(np.searchsorted(self.timestamp, timestamp - 1e-6))
+        if (num_obs == len(self.timestamp)) or (abs(self.timestamp[num_obs] - timestamp) > 1e-6):
+            raise ValueError('{} is not in time array'.format(timestamp))
+        return num_obs
+
+
+def _convert(file_name, time_interval, decimate=1, aggregate=None):
+    ''' Преобразование файла в процессе пула (PyGNSS.ingest)'''
+    return PyGNSS(file_name, time_interval, decimate=decimate, aggregate=aggregate).path
@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic GNSS data generator
+
+Deterministic RINEX 3 observation, RINEX 3 navigation and SP3 files of
+configurable duration, rate and satellite count. Satellites move on circular
+orbits of GPS, GLONASS and Galileo constellations, observations are computed for
+a static receiver (RECEIVER, ECEF, m) and are consistent with the orbits:
+    pseudorange = range + c * (receiver clock - satellite clock) + troposphere + ionosphere + noise
+    phase = (range + c * (receiver clock - satellite clock) + troposphere - ionosphere) / wavelength + ambiguity
+    doppler = -range rate / wavelength
+Satellites below 5 degrees elevation are not observed. Same arguments give the same files.
+
+Functions:
+    write_rinex(file_name, hours, rate, num_SV, seed) - observation file
+    write_nav(file_name, hours, num_SV, gnss) - navigation file of one GNSS: GLONASS state vectors
+        (liter table), GPS/Galileo Keplerian elements exactly matching the circular orbits
+    write_sp3(file_name, hours, num_SV, step) - precise orbits and clocks
+    write_crx(file_name, file_crx, order=3) - Hatanaka compression (CRINEX 3) of observation file
+    write_session(file_name, hours, rate, num_SV, seed, sp3=True) - all files with PyGNSS names:
+        <name>.16o, <name>.16g, <name>.16n, <name>.16l, <name>.sp3
+
+Usage:
+    python synthetic.py file_name.16o [hours] [rate, s] [SV per GNSS]
+"""
+
+from datetime import datetime, timedelta
+import sys
+
+import numpy as np
+
+SPEED = 299792458.0  # скорость света, м/с
+OMEGA = 7.2921151467e-5  # угловая скорость вращения Земли, рад/с
+MU = 3.986004418e14  # гравитационный параметр Земли, м^3/с^2
+START = datetime(2016, 5, 20)  # начало данных по умолчанию
+RECEIVER = np.array([2849216.0, 2195983.0, 5249278.0])  # положение приёмника, ECEF, м
+
+# орбитальные группировки: число НКА, число плоскостей, наклонение (град), радиус орбиты (м)
+CONSTELLATION = {'G': (32, 6, 55.0, 26560e3), 'R': (24, 3, 64.8, 25510e3), 'E': (30, 3, 56.0, 29600e3)}
+# литеры ГЛОНАСС по номерам НКА
+# шаг записей навигационных файлов, с; гравитационный параметр бортовых эфемерид GPS, Galileo, м^3/с^2
+NAV_STEP = {'G': 7200, 'R': 1800, 'E': 600}
+NAV_MU = {'G': 3.986005e14, 'E': 3.986004418e14}
+GPS_START = datetime(1980, 1, 6)  # начало шкалы недель GPS
+LITERS = [1, -4, 5, 6, 1, -4, 5, 6, -2, -7, 0, -1, -2, -7, 0, -1, 4, -3, 3, 2, 4, -3, 3, 2]
+# виды измерений ГНСС, цифра - номер частоты
+OBS_TYPES = {'G': ['C1C', 'L1C', 'D1C', 'S1C', 'C2W', 'L2W'],
+             'R': ['C1C', 'L1C', 'D1C', 'S1C', 'C2C', 'L2C'],
+             'E': ['C1C', 'L1C', 'D1C', 'S1C', 'C5Q', 'L5Q']}
+
+
+def frequency(gnss, band, liter=0):
+    ''' Несущая частота, Гц; band - номер частоты в виде измерения (1, 2, 5)'''
+    if gnss == 'R':
+        return 1602e6 + liter * 0.5625e6 if band == 1 else 1246e6 + liter * 0.4375e6
+    return {1: 1575.42e6, 2: 1227.6e6, 5: 1176.45e6}[band]
+
+
+def elements(gnss, num):
+    ''' Элементы круговой орбиты НКА: долгота восходящего узла (инерциальная), наклонение (рад),
+    радиус (м), аргумент широты на START'''
+    num_SV, planes, inclination, radius = CONSTELLATION[gnss]
+    per_plane = -(-num_SV // planes)
+    plane, slot = (num - 1) // per_plane, (num - 1) % per_plane
+    return 2 * np.pi * plane / planes, np.radians(inclination), radius, 2 * np.pi * slot / per_plane + 0.3 * plane
+
+
+def orbit(gnss, num, vct_time):
+    ''' Положение (ECEF, м) и скорость (м/с) НКА на моменты vct_time (с от START): массивы (моменты x 3)'''
+    node, inclination, radius, arg = elements(gnss, num)
+    motion = np.sqrt(MU / radius ** 3)
+    arg = arg + motion * vct_time  # аргумент широты
+    # инерциальная система
+    x, y = radius * np.cos(arg), radius * np.sin(arg)
+    vx, vy = -radius * motion * np.sin(arg), radius * motion * np.cos(arg)
+    inertial = np.stack((x * np.cos(node) - y * np.cos(inclination) * np.sin(node),
+                         x * np.sin(node) + y * np.cos(inclination) * np.cos(node),
+                         y * np.sin(inclination)), axis=-1)
+    velocity = np.stack((vx * np.cos(node) - vy * np.cos(inclination) * np.sin(node),
+                         vx * np.sin(node) + vy * np.cos(inclination) * np.cos(node),
+                         vy * np.sin(inclination)), axis=-1)
+    # поворот в ECEF
+    angle = OMEGA * vct_time
+    cos, sin = np.cos(angle), np.sin(angle)
+    pos = np.stack((inertial[:, 0] * cos + inertial[:, 1] * sin,
+                    inertial[:, 1] * cos - inertial[:, 0] * sin, inertial[:, 2]), axis=-1)
+    vel = np.stack((velocity[:, 0] * cos + velocity[:, 1] * sin + OMEGA * pos[:, 1],
+                    velocity[:, 1] * cos - velocity[:, 0] * sin - OMEGA * pos[:, 0], velocity[:, 2]), axis=-1)
+    return pos, vel
+
+
+def sat_clock(gnss, num, vct_time):
+    ''' Смещение часов НКА, с'''
+    return ({'G': 1e-5, 'R': -2e-5, 'E': 3e-5}[gnss] * ((num % 7) - 3) / 3) + 1e-11 * vct_time
+
+
+def rx_clock(gnss, vct_time):
+    ''' Смещение часов приёмника относительно шкалы ГНСС, с'''
+    return 2e-4 + 1e-9 * vct_time + {'G': 0, 'R': 3e-8, 'E': -2e-8}[gnss]
+
+
+def list_satellites(num_SV=None):
+    ''' Список (ГНСС, номер); num_SV - число НКА каждой ГНСС или словарь {ГНСС: число}'''
+    if not isinstance(num_SV, dict):
+        num_SV = {gnss: CONSTELLATION[gnss][0] if num_SV is None else num_SV for gnss in CONSTELLATION}
+    return [(gnss, num) for gnss in CONSTELLATION for num in range(1, min(num_SV.get(gnss, 0),
+                                                                          CONSTELLATION[gnss][0]) + 1)]
+
+
+def observations(gnss, num, vct_time, rnd):
+    ''' Измерения НКА на моменты vct_time (с от START, время приёмника): {вид: массив}, nan - НКА не виден'''
+    clock_rx = rx_clock(gnss, vct_time)
+    delay = np.full(len(vct_time), 0.075)
+    for _ in range(3):
+        time_tx = vct_time - clock_rx - delay
+        pos, vel = orbit(gnss, num, time_tx)
+        angle = OMEGA * delay  # поворот Земли за время распространения
+        pos = np.stack((pos[:, 0] * np.cos(angle) + pos[:, 1] * np.sin(angle),
+                        pos[:, 1] * np.cos(angle) - pos[:, 0] * np.sin(angle), pos[:, 2]), axis=-1)
+        los = pos - RECEIVER
+        distance = np.linalg.norm(los, axis=1)
+        delay = distance / SPEED
+    sin_elev = los @ (RECEIVER / np.linalg.norm(RECEIVER)) / distance
+    visible = sin_elev > np.sin(np.radians(5))
+    liter = LITERS[num - 1] if (gnss == 'R') and (num <= len(LITERS)) else 0
+    geometry = distance + SPEED * (clock_rx - sat_clock(gnss, num, time_tx)) + 2.3 / np.maximum(sin_elev, 0.1)
+    iono = 4.0 / np.maximum(sin_elev, 0.1) * (1575.42e6 / frequency(gnss, 1, liter)) ** 2  # задержка на L1, м
+    rate = (vel * los).sum(axis=1) / distance
+    dict_obs = {}
+    for obs_type in OBS_TYPES[gnss]:
+        band = int(obs_type[1])
+        wavelength = SPEED / frequency(gnss, band, liter)
+        iono_band = iono * (frequency(gnss, 1, liter) / frequency(gnss, band, liter)) ** 2
+        if obs_type[0] == 'C':
+            value = geometry + iono_band + rnd.normal(0, 0.3, len(vct_time))
+        elif obs_type[0] == 'L':
+            ambiguity = rnd.integers(-100000, 100000)
+            value = (geometry - iono_band + rnd.normal(0, 0.002, len(vct_time))) / wavelength + ambiguity
+        elif obs_type[0] == 'D':
+            value = -rate / wavelength
+        else:
+            value = 30 + 20 * sin_elev
+        dict_obs[obs_type] = np.where(visible, value, np.nan)
+    return dict_obs
+
+
+def write_rinex(file_name, hours=1, rate=30, num_SV=None, seed=0, start=START):
+    ''' RINEX 3 с измерениями всех видимых НКА на каждой эпохе.
+    :return: число эпох'''
+    vct_time = np.arange(int(round(hours * 3600 / rate))) * rate
+    rnd = np.random.default_rng(seed)
+    list_SV = list_satellites(num_SV)
+    # строки НКА по эпохам: имя и измерения, None - НКА не виден
+    list_lines = []
+    for gnss, num in list_SV:
+        dict_obs = observations(gnss, num, vct_time, rnd)
+        block = np.column_stack([dict_obs[obs_type] for obs_type in OBS_TYPES[gnss]])
+        visible = ~np.isnan(block[:, 0])
+        lines = np.full(len(vct_time), None, dtype=object)
+        name = '{}{:02d}'.format(gnss, num)
+        lines[visible] = [name + ''.join('{:14.3f}  '.format(obs) for obs in row).rstrip()
+                          for row in block[visible].tolist()]
+        list_lines.append(lines)
+    file_rinexobs = open(file_name, 'w')
+    file_rinexobs.write('     3.02           OBSERVATION DATA    M                   RINEX VERSION / TYPE\n')
+    file_rinexobs.write('pygnss synthetic'.ljust(60) + 'PGM / RUN BY / DATE\n')
+    file_rinexobs.write('{:14.4f}{:14.4f}{:14.4f}'.format(*RECEIVER).ljust(60) + 'APPROX POSITION XYZ\n')
+    for gnss, obs_types in OBS_TYPES.items():
+        file_rinexobs.write('{}  {:3d} {}'.format(gnss, len(obs_types), ' '.join(obs_types)).ljust(60) +
+                            'SYS / # / OBS TYPES\n')
+    file_rinexobs.write('{:10.3f}'.format(rate).ljust(60) + 'INTERVAL\n')
+    file_rinexobs.write(' ' * 60 + 'END OF HEADER\n')
+    for num_obs, time_rx in enumerate(vct_time.tolist()):
+        epoch = start + timedelta(seconds=time_rx)
+        lines = [lines[num_obs] for lines in list_lines if lines[num_obs] is not None]
+        file_rinexobs.write('> {:%Y %m %d %H %M} {:10.7f}  0{:3d}\n'.format(
+            epoch, epoch.second + epoch.microsecond * 1e-6, len(lines)))
+        file_rinexobs.write('\n'.join(lines) + '\n' if lines else '')
+    file_rinexobs.close()
+    return len(vct_time)
+
+
+def textdiff(text, text_new):
+    ''' Разность строк Hatanaka: ' ' - символ не изменился, '&' - пробел вместо символа или за концом прежней строки'''
+    text_new = text_new.ljust(len(text))
+    return ''.join(' ' if (num < len(text)) and (text[num] == char) else ('&' if char == ' ' else char)
+                   for num, char in enumerate(text_new)).rstrip()
+
+
+def write_crx(file_name, file_crx, order=3):
+    ''' Сжатие файла измерений RINEX 3 в Hatanaka (CRINEX 3): строки эпох и флаги LLI/SSI - разности текста
+    с предыдущими, измерения - разности порядка order целых тысячных, дуга начинается заново после пропуска.
+    Смещение часов приёмника не переносится (write_rinex его не пишет)'''
+    file_rinexobs = open(file_name)
+    file_out = open(file_crx, 'w')
+    file_out.write('3.0'.ljust(20) + 'COMPACT RINEX FORMAT'.ljust(40) + 'CRINEX VERS   / TYPE\n')
+    file_out.write('pygnss synthetic'.ljust(40) + '{:%d-%b-%y %H:%M}'.format(START).ljust(20) + 'CRINEX PROG / DATE\n')
+    num_types = {}
+    for line in file_rinexobs:
+        file_out.write(line)
+        if 'SYS / # / OBS TYPES' in line and line[0] != ' ':
+            num_types[line[0]] = int(line[3:6])
+        elif 'END OF HEADER' in line:
+            break
+    epoch = ''
+    dict_arcs = {}  # НКА прошлой эпохи: (разности видов измерений, флаги)
+    for line in file_rinexobs:
+        line = line.rstrip('\n')
+        list_lines = [next(file_rinexobs).rstrip('\n') for _ in range(int(line[32:35]))]
+        if line[31] > '1':
+            # событие - без сжатия, следующая эпоха - полностью
+            file_out.write('\n'.join([line] + list_lines) + '\n')
+            epoch = ''
+            dict_arcs = {}
+            continue
+        epoch_new = line[:35].ljust(41) + ''.join(SV_line[:3] for SV_line in list_lines)
+        file_out.write((epoch_new if not epoch else textdiff(epoch, epoch_new)) + '\n\n')  # смещения часов нет
+        epoch = epoch_new
+        dict_prev, dict_arcs = dict_arcs, {}
+        for SV_line in list_lines:
+            size = num_types[SV_line[0]]
+            arcs, flags = dict_prev.get(SV_line[:3], ([None] * size, ''))
+            list_fields = []
+            for num in range(size):
+                text = SV_line[3 + 16 * num:17 + 16 * num].strip()
+                if not text:
+                    arcs[num] = None
+                    list_fields.append('')
+                elif arcs[num] is None:
+                    arcs[num] = [int(round(float(text) * 1000))]
+                    list_fields.append('{}&{}'.format(order, arcs[num][0]))
+                else:
+                    # разности до порядка order по предыдущим
+                    diffs = [int(round(float(text) * 1000))]
+                    for diff in arcs[num][:order]:
+                        diffs.append(diffs[-1] - diff)
+                    arcs[num] = diffs
+                    list_fields.append(str(diffs[-1]))
+            flags_new = ''.join(SV_line[17 + 16 * num:19 + 16 * num].ljust(2) for num in range(size))
+            diff = textdiff(flags, flags_new)
+            file_out.write(' '.join(list_fields) + (' ' + diff if diff else '') + '\n')
+            dict_arcs[SV_line[:3]] = (arcs, flags_new)
+    file_rinexobs.close()
+    file_out.close()
+
+
+def write_nav(file_name, hours=1, num_SV=None, start=START, step=None, gnss='R'):
+    ''' Навигационный файл RINEX 3 одной ГНСС с записями каждые step секунд (по умолчанию NAV_STEP):
+    ГЛОНАСС - координаты, скорости (км, км/с), литеры; GPS, Galileo - кеплеровы элементы
+    круговых орбит (гравитационный параметр ГНСС учтён поправкой среднего движения)'''
+    step = step or NAV_STEP[gnss]
+    file_nav = open(file_name, 'w')
+    file_nav.write('     3.02           N: GNSS NAV DATA    {}: {:<16}RINEX VERSION / TYPE\n'.format(
+        gnss, {'G': 'GPS', 'R': 'GLONASS', 'E': 'GALILEO'}[gnss]))
+    file_nav.write(' ' * 60 + 'END OF HEADER\n')
+    field = lambda value: '{:19.12E}'.format(value).replace('E', 'D')
+    line = lambda *values: '    ' + ''.join(field(value) for value in values) + '\n'
+    for time_nav in np.arange(0, hours * 3600 + step, step):
+        epoch = start + timedelta(seconds=float(time_nav))
+        week, sow = divmod((epoch - GPS_START).total_seconds(), 604800)
+        for gnss_SV, num in list_satellites(num_SV):
+            if gnss_SV != gnss:
+                continue
+            file_nav.write('{}{:02d} {:%Y %m %d %H %M %S}'.format(gnss, num, epoch) +
+                           field(sat_clock(gnss, num, time_nav)))
+            if gnss == 'R':
+                pos, vel = orbit(gnss, num, np.array([time_nav]))
+                pos, vel = pos[0] * 1e-3, vel[0] * 1e-3
+                liter = LITERS[num - 1] if num <= len(LITERS) else 0
+                file_nav.write(field(1e-11) + field(time_nav % 86400) + '\n')
+                file_nav.write(line(pos[0], vel[0], 0, 0) + line(pos[1], vel[1], 0, liter) +
+                               line(pos[2], vel[2], 0, 0))
+                continue
+            node, inclination, radius, arg = elements(gnss, num)
+            motion = np.sqrt(MU / radius ** 3)
+            delta_n = motion - np.sqrt(NAV_MU[gnss] / radius ** 3)
+            # узел в ECEF на toe: node - OMEGA * time_nav = node0 - OMEGA * sow
+            node0 = node - OMEGA * time_nav + OMEGA * sow
+            file_nav.write(field(1e-11) + field(0) + '\n')
+            file_nav.write(line(0, 0, delta_n, arg + motion * time_nav) + line(0, 0, 0, np.sqrt(radius)) +
+                           line(sow, 0, node0, 0) + line(inclination, 0, 0, 0) + line(0, 0, week, 0) +
+                           line(2, 0, 0, 0) + line(sow, 4))
+    file_nav.close()
+
+
+def write_sp3(file_name, hours=1, num_SV=None, start=START, step=900):
+    ''' SP3: координаты (км) и часы (мкс) НКА с шагом step секунд, с запасом узлов по краям'''
+    list_SV = list_satellites(num_SV)
+    vct_time = np.arange(-4 * step, hours * 3600 + 5 * step, step, dtype=float)
+    dict_pos = {(gnss, num): orbit(gnss, num, vct_time)[0] * 1e-3 for gnss, num in list_SV}
+    file_sp3 = open(file_name, 'w')
+    file_sp3.write('#cP{:%Y %m %d %H %M} {:11.8f} {:7d} ORBIT IGS14 HLM  IGS\n'.format(
+        start + timedelta(seconds=vct_time[0]), 0, len(vct_time)))
+    for num_node, time_node in enumerate(vct_time.tolist()):
+        epoch = start + timedelta(seconds=time_node)
+        file_sp3.write('*  {:%Y %m %d %H %M} {:11.8f}\n'.format(epoch, float(epoch.second)))
+        for gnss, num in list_SV:
+            file_sp3.write('P{}{:02d}{:14.6f}{:14.6f}{:14.6f}{:14.6f}\n'.format(
+                gnss, num, *dict_pos[gnss, num][num_node], sat_clock(gnss, num, time_node) * 1e6))
+    file_sp3.write('EOF\n')
+    file_sp3.close()
+
+
+def write_session(file_name, hours=1, rate=30, num_SV=None, seed=0, start=START, sp3=True):
+    ''' Измерения, навигационные файлы ГНСС и SP3 (sp3=False - без него) рядом, с именами, которые ищет PyGNSS.
+    :return: число эпох'''
+    num_epochs = write_rinex(file_name, hours, rate, num_SV, seed, start)
+    for gnss, ext in (('R', 'g'), ('G', 'n'), ('E', 'l')):
+        write_nav(file_name[:-1] + ext, hours, num_SV, start, gnss=gnss)
+    if sp3:
+        write_sp3(file_name[:-3] + 'sp3', hours, num_SV, start)
+    return num_epochs
+
+
+if __name__ == '__main__':
+    write_session(sys.argv[1], *[float(arg) for arg in sys.argv[2:4]],
+                  *[int(arg) for arg in sys.argv[4:5]])
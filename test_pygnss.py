@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+PyGNSS round-trip tests on synthetic data
+
+Files are generated by synthetic.write_session / write_crx into a temporary folder, converted and compared:
+    parsing - with the RINEX text read line by line
+    compressed and Hatanaka input - with plain RINEX conversion; truncated input raises and leaves no folder
+    csv cache migration - with the converted arrays
+    refresh of a growing file - with a fresh conversion (arrays, arcs tables, SV dicts with ephemerides);
+        rewritten file, refresh of a query view
+    ingest of overlapping files - with the whole file
+    aggregation - centred on grid epochs; Lagrange interpolation over missing SP3 nodes
+
+Usage:
+    python -m pytest test_pygnss.py
+"""
+
+import bz2
+from datetime import datetime
+import gzip
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+import synthetic
+from pygnss import LagrangeInterpolator, PyGNSS
+
+
+def rinex_epochs(text):
+    ''' Индексы начала строк меток времени в тексте RINEX'''
+    return [num for num in range(len(text)) if text.startswith('>', num)]
+
+
+def copy_session(src, dst):
+    ''' Копия файла измерений src в dst вместе с навигационными файлами и SP3 (имена - по dst)'''
+    shutil.copy(src, dst)
+    for ext in ('g', 'n', 'l'):
+        if os.path.exists(src[:-1] + ext):
+            shutil.copy(src[:-1] + ext, dst[:-1] + ext)
+    if os.path.exists(src[:-3] + 'sp3'):
+        shutil.copy(src[:-3] + 'sp3', dst[:-3] + 'sp3')
+
+
+def assert_same_obs(gnss_a, gnss_b):
+    ''' Совпадение векторов времени и измерений всех ГНСС'''
+    assert np.array_equal(gnss_a.continious_time, gnss_b.continious_time)
+    for gnss in PyGNSS.__svmax__:
+        assert np.array_equal(gnss_a.__obsblock__(gnss), gnss_b.__obsblock__(gnss), equal_nan=True), gnss
+
+
+@pytest.fixture(scope='module')
+def session(tmp_path_factory):
+    ''' Сеанс 2 ч с шагом 30 с: измерения, навигационные файлы и SP3'''
+    file_name = str(tmp_path_factory.mktemp('session') / 's.16o')
+    synthetic.write_session(file_name, 2, 30)
+    return file_name
+
+
+def test_parse_matches_rinex_text(session, tmp_path):
+    copy_session(session, str(tmp_path / 'p.16o'))
+    gnss_data = PyGNSS(str(tmp_path / 'p.16o'))
+    text = open(session).read()
+    ind = rinex_epochs(text)
+    assert len(gnss_data.continious_time) == len(ind)
+    lines = text[ind[0]:].splitlines()
+    num_obs = -1
+    for line in lines:
+        if line[0] == '>':
+            num_obs += 1
+            epoch = datetime(*map(int, line[2:19].split()), int(float(line[19:29])))
+            assert gnss_data.continious_time[num_obs] == pytest.approx(epoch.timestamp())
+            continue
+        values = [float(line[k:k + 14]) if line[k:k + 14].strip() else np.nan for k in range(3, len(line), 16)]
+        row = gnss_data.__obsblock__(line[0], num_obs, num_obs + 1)[0, int(line[1:3]) - 1]
+        assert np.array_equal(row[:len(values)], values, equal_nan=True), line[:3]
+    # НКА, не встреченные в файле, пусты
+    assert sorted(gnss_data.SV_list_full) == sorted({line[:3] for line in lines if line[0] != '>'})
+
+
+def test_compressed_and_hatanaka_match_plain(session, tmp_path):
+    copy_session(session, str(tmp_path / 'p.16o'))
+    reference = PyGNSS(str(tmp_path / 'p.16o'))
+    data = open(session, 'rb').read()
+    open(tmp_path / 'z.16o.gz', 'wb').write(gzip.compress(data))
+    open(tmp_path / 'b.16o.bz2', 'wb').write(bz2.compress(data))
+    synthetic.write_crx(session, str(tmp_path / 'c.16d'))
+    open(tmp_path / 'h.16d.gz', 'wb').write(gzip.compress(open(tmp_path / 'c.16d', 'rb').read()))
+    for name in ('z.16o.gz', 'b.16o.bz2', 'c.16d', 'h.16d.gz'):
+        gnss_data = PyGNSS(str(tmp_path / name))
+        assert_same_obs(gnss_data, reference)
+        assert gnss_data.__meta__['tail'] is None  # дочитывается только несжатый RINEX
+
+
+def test_truncated_input_leaves_no_folder(session, tmp_path):
+    data = gzip.compress(open(session, 'rb').read())
+    file_name = str(tmp_path / 't.16o.gz')
+    open(file_name, 'wb').write(data[:len(data) // 2])
+    for _ in range(2):
+        with pytest.raises(EOFError):
+            PyGNSS(file_name)
+        assert not os.path.exists(file_name + PyGNSS.__pathext__)
+    # папка без manifest.json от прерванного преобразования не принимается за папку csv
+    os.mkdir(file_name + PyGNSS.__pathext__)
+    np.save(file_name + PyGNSS.__pathext__ + '/time.npy', np.arange(3.0))
+    open(file_name, 'wb').write(data)
+    assert len(PyGNSS(file_name).continious_time) == len(rinex_epochs(open(session).read()))
+
+
+def test_csv_migration(session, tmp_path):
+    file_name = str(tmp_path / 'm.16o')
+    copy_session(session, file_name)
+    reference = PyGNSS(file_name)
+    block = {gnss: reference.__obsblock__(gnss) for gnss in PyGNSS.__svmax__}
+    litertable = list(reference.__meta__['litertable'])
+    reference.remove()
+    # папка прежнего формата: time.csv, litertable.csv, <SV>.obs.csv
+    path = file_name + PyGNSS.__pathext__
+    os.mkdir(path)
+    np.savetxt(path + '/time.csv', np.asarray(reference.continious_time), fmt='%.17g')
+    np.savetxt(path + '/litertable.csv', np.array([np.nan if prn is None else prn for prn in litertable]),
+               fmt='%.17g')
+    for SV_name in reference.SV_list_full:
+        obs_types = reference.__meta__['obs_types'][SV_name[0]]
+        with open('{}/{}.obs.csv'.format(path, SV_name), 'w') as file_csv:
+            file_csv.write(';'.join(obs_types) + '\n')
+            for row in block[SV_name[0]][:, int(SV_name[1:]) - 1].tolist():
+                file_csv.write(';'.join('' if np.isnan(obs) else repr(obs) for obs in row) + '\n')
+    gnss_data = PyGNSS(file_name)
+    assert gnss_data.__meta__['version'] == PyGNSS.__version__
+    assert gnss_data.__meta__['time_interval'] == 30.0
+    assert not [name for name in os.listdir(path) if name.endswith('.csv')]
+    for gnss in PyGNSS.__svmax__:
+        assert np.array_equal(gnss_data.__obsblock__(gnss), block[gnss], equal_nan=True), gnss
+    assert gnss_data.derived('G')['IF'].shape == (len(gnss_data.continious_time), PyGNSS.__svmax__['G'])
+
+
+def test_refresh_matches_fresh_conversion(tmp_path):
+    source = str(tmp_path / 'src.16o')
+    synthetic.write_session(source, 2, 10)
+    text = open(source).read()
+    ind = rinex_epochs(text) + [len(text)]
+    file_name = str(tmp_path / 'g.16o')
+    copy_session(source, file_name)
+    open(file_name, 'w').write(text[:ind[300]])
+    gnss_data = PyGNSS(file_name, 10)
+    list_SV = ['G01', 'R02', 'E03']
+    for SV_name in list_SV:
+        getattr(gnss_data, SV_name)
+    # по одной эпохе, затем с незаконченной строкой и остаток файла
+    cuts = [ind[num] for num in range(301, 321)] + [ind[500] + 20, len(text)]
+    num_epochs = 300
+    for cut in cuts:
+        with open(file_name, 'a') as file_rinexobs:
+            file_rinexobs.write(text[os.path.getsize(file_name):cut])
+        num_epochs += gnss_data.refresh()
+        assert num_epochs == len(gnss_data.continious_time)
+    assert gnss_data.refresh() == 0
+    reference = PyGNSS(source, 10)
+    assert_same_obs(gnss_data, reference)
+    for gnss in PyGNSS.__svmax__:
+        assert np.array_equal(np.load('{}/{}.arcs.npy'.format(gnss_data.path, gnss)),
+                              np.load('{}/{}.arcs.npy'.format(reference.path, gnss))), gnss
+    for SV_name in list_SV:
+        SV, SV_ref = getattr(gnss_data, SV_name), getattr(reference, SV_name)
+        for key, value in SV_ref.items():
+            if isinstance(value, np.ndarray):
+                assert np.array_equal(SV[key], value, equal_nan=True), (SV_name, key)
+        assert not np.isnan(SV['x']).all()
+    # при повторном открытии дочитывать нечего
+    assert len(PyGNSS(file_name, 10).continious_time) == num_epochs
+
+
+def test_refresh_rewritten_file(tmp_path):
+    file_name = str(tmp_path / 'w.16o')
+    synthetic.write_rinex(file_name, 1, 30)
+    synthetic.write_rinex(str(tmp_path / 'other.16o'), 2, 30, num_SV=6, seed=3)
+    gnss_data = PyGNSS(file_name)
+    list_old = list(gnss_data.SV_list_full)
+    for SV_name in list_old:
+        getattr(gnss_data, SV_name)
+    # другой, более длинный файл на месте прежнего
+    shutil.copy(str(tmp_path / 'other.16o'), file_name)
+    gnss_data.refresh()
+    reference = PyGNSS(str(tmp_path / 'other.16o'))
+    assert_same_obs(gnss_data, reference)
+    for SV_name in list_old:
+        if SV_name in reference.SV_list_full:
+            assert np.array_equal(getattr(gnss_data, SV_name)['C1C'], getattr(reference, SV_name)['C1C'],
+                                  equal_nan=True)
+        else:
+            with pytest.raises(AttributeError):
+                getattr(gnss_data, SV_name)
+    # файл перемещён: открытие без сообщений
+    os.rename(file_name, str(tmp_path / 'moved.16o'))
+    PyGNSS(file_name)
+
+
+def test_refresh_of_view(session, tmp_path):
+    text = open(session).read()
+    ind = rinex_epochs(text)
+    file_name = str(tmp_path / 'v.16o')
+    open(file_name, 'w').write(text[:ind[100]])
+    gnss_data = PyGNSS(file_name)
+    view = gnss_data.query(gnss='G')
+    with open(file_name, 'a') as file_rinexobs:
+        file_rinexobs.write(text[ind[100]:])
+    assert view.refresh() == len(ind) - 100
+    assert gnss_data.refresh() == len(ind) - 100
+    assert len(gnss_data.continious_time) == len(view.continious_time) == len(ind)
+
+
+def test_ingest_matches_single_file(session, tmp_path):
+    text = open(session).read()
+    ind = rinex_epochs(text)
+    header = text[:ind[0]]
+    # два файла с перекрытием в 20 эпох
+    open(tmp_path / 'a.16o', 'w').write(text[:ind[70]])
+    open(tmp_path / 'b.16o', 'w').write(header + text[ind[50]:])
+    gnss_data = PyGNSS.ingest([str(tmp_path / 'a.16o'), str(tmp_path / 'b.16o')], str(tmp_path / 'sess'),
+                              processes=1)
+    copy_session(session, str(tmp_path / 'p.16o'))
+    assert_same_obs(gnss_data, PyGNSS(str(tmp_path / 'p.16o')))
+
+
+def test_aggregate_centred_on_grid_epochs(tmp_path):
+    file_name = str(tmp_path / 'r.16o')
+    synthetic.write_rinex(file_name, 0.25, 1)
+    raw = PyGNSS(file_name, 1)
+    step = 10
+    for aggregate in ('mean', 'median'):
+        shutil.copy(file_name, str(tmp_path / '{}.16o'.format(aggregate)))
+        gnss_data = PyGNSS(str(tmp_path / '{}.16o'.format(aggregate)), step, aggregate=aggregate)
+        assert np.allclose(gnss_data.continious_time[:-1], raw.continious_time[::step])
+        for gnss, obs_types in gnss_data.__meta__['obs_types'].items():
+            code = [num for num, obs_type in enumerate(obs_types) if obs_type[0] == 'C']
+            other = [num for num, obs_type in enumerate(obs_types) if obs_type[0] != 'C']
+            block, block_raw = gnss_data.__obsblock__(gnss)[:-1], raw.__obsblock__(gnss)[::step]
+            # код - свёртка симметричного интервала: на эпохе сетки совпадает с самим измерением до шума,
+            # в т.ч. на краях дуг (при сдвиге на шаг файла разница - сотни метров)
+            deviation = np.abs(block[..., code] - block_raw[..., code])
+            assert np.nanmax(deviation) < 2, (aggregate, gnss)
+            assert np.array_equal(block[..., other], block_raw[..., other], equal_nan=True), gnss
+
+
+def test_lagrange_missing_nodes():
+    time_nodes = np.arange(0, 86400, 900.0)
+    values = np.stack([np.sin(2 * np.pi * time_nodes / 43200 + phase) for phase in (0, 1)], axis=1)[:, :, None]
+    time_query = np.arange(time_nodes[5], time_nodes[-5], 30.0)
+    reference = LagrangeInterpolator(time_nodes)(values, time_query)
+    values[40, 0] = np.nan  # один пропущенный узел - интерполяция по остальным
+    values[20:36, 1] = np.nan  # 4 ч без узлов - nan, а не выдуманные значения
+    result = LagrangeInterpolator(time_nodes)(values, time_query)
+    assert not np.isnan(result[:, 0]).any()
+    assert np.nanmax(np.abs(result[:, 0] - reference[:, 0])) < 1e-6
+    gap = (time_query > time_nodes[19]) & (time_query < time_nodes[36])
+    assert np.isnan(result[gap, 1]).all()
+    assert np.nanmax(np.abs(result[~gap, 1] - reference[~gap, 1])) < 1e-6
+    assert not np.isnan(result[~gap, 1]).any()